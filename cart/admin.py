@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cart, CartItem
+from .models import Cart, CartItem, StockReservation
 
 
 class CartItemInline(admin.TabularInline):
@@ -8,14 +8,22 @@ class CartItemInline(admin.TabularInline):
     readonly_fields = ('total_price',)
 
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'product', 'product_size__size'
+        )
+
+
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('session_key', 'total_items', 'subtotal', 'created_at',
-                    'updated_at')
+    list_display = ('session_key', 'user', 'item_count', 'subtotal',
+                    'created_at', 'updated_at')
     list_filter = ('created_at', 'updated_at')
-    search_fields = ('session_key',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('session_key', 'user__email')
     inlines = [CartItemInline]
-    readonly_fields = ('total_items', 'subtotal')
+    readonly_fields = ('item_count', 'subtotal')
 
 
 @admin.register(CartItem)
@@ -23,5 +31,17 @@ class CartItemAdmin(admin.ModelAdmin):
     list_display = ('cart', 'product', 'product_size',
                     'quantity', 'total_price', 'added_at')
     list_filter = ('added_at',)
+    list_select_related = ('cart', 'product', 'product_size__size',
+                           'product_size__product')
     search_fields = ('product__name', 'cart__session_key')
     readonly_fields = ('total_price',)
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('cart', 'product_size', 'quantity', 'expires_at')
+    list_filter = ('expires_at',)
+    list_select_related = ('cart', 'product_size__size',
+                           'product_size__product')
+    search_fields = ('cart__session_key', 'product_size__product__name')
+    readonly_fields = ('cart', 'product_size', 'quantity')
@@ -0,0 +1,138 @@
+from django.db import transaction
+from django.utils import timezone
+from main.models import ProductSize
+from .models import Cart, CartItem, StockReservation
+from .reservations import availability_changed, get_reservation_ttl
+
+
+class BatchError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(errors))
+
+
+def resolve_targets(items, operations):
+    by_id = {item.pk: item for item in items}
+    targets = {item.product_size_id: item.quantity for item in items}
+    errors = []
+
+    for index, operation in enumerate(operations):
+        if operation['op'] == 'add':
+            product_size_id = operation['product_size']
+            targets[product_size_id] = targets.get(product_size_id, 0) \
+                + operation['quantity']
+            continue
+
+        item = by_id.get(operation['item'])
+        if item is None:
+            errors.append(f'Operation {index}: item not found.')
+        elif operation['op'] == 'update':
+            targets[item.product_size_id] = operation['quantity']
+        else:
+            targets[item.product_size_id] = 0
+
+    if errors:
+        raise BatchError(errors)
+    return targets
+
+
+def apply_operations(cart, operations):
+    with transaction.atomic():
+        items = {
+            item.product_size_id: item
+            for item in cart.items.select_for_update()
+        }
+        targets = resolve_targets(items.values(), operations)
+        targets = {
+            pk: quantity for pk, quantity in targets.items()
+            if pk not in items or items[pk].quantity != quantity
+        }
+        if not targets:
+            return cart
+
+        reservations = {
+            reservation.product_size_id: reservation
+            for reservation in StockReservation.objects.select_for_update()
+            .filter(cart=cart, product_size__in=targets)
+        }
+        sizes = {
+            product_size.pk: product_size
+            for product_size in ProductSize.objects.select_for_update()
+            .select_related('size', 'product')
+            .filter(pk__in=targets).order_by('pk')
+        }
+
+        errors = []
+        for pk, quantity in targets.items():
+            product_size = sizes.get(pk)
+            if product_size is None:
+                errors.append(f'Size {pk} not found.')
+                continue
+            held = getattr(reservations.get(pk), 'quantity', 0)
+            available = product_size.stock - product_size.reserved + held
+            if quantity > available:
+                errors.append(
+                    f'{product_size.product.name} ({product_size.size.name}): '
+                    f'only {max(available, 0)} items available'
+                )
+        if errors:
+            raise BatchError(errors)
+
+        expires_at = timezone.now() + get_reservation_ttl()
+        new_items, changed_items, removed_items = [], [], []
+        new_reservations, changed_reservations, removed_reservations = \
+            [], [], []
+
+        crossed = []
+        for pk, quantity in targets.items():
+            product_size = sizes[pk]
+            item = items.get(pk)
+            reservation = reservations.get(pk)
+            was_available = product_size.available > 0
+            product_size.reserved = max(
+                product_size.reserved + quantity
+                - getattr(reservation, 'quantity', 0), 0
+            )
+            if was_available != (product_size.available > 0):
+                crossed.append(pk)
+
+            if quantity == 0:
+                if item:
+                    removed_items.append(item.pk)
+                if reservation:
+                    removed_reservations.append(reservation.pk)
+                continue
+
+            if item:
+                item.quantity = quantity
+                changed_items.append(item)
+            else:
+                new_items.append(CartItem(
+                    cart=cart, product_id=product_size.product_id,
+                    product_size=product_size, quantity=quantity,
+                ))
+
+            if reservation:
+                reservation.quantity = quantity
+                reservation.expires_at = expires_at
+                changed_reservations.append(reservation)
+            else:
+                new_reservations.append(StockReservation(
+                    cart=cart, product_size=product_size, quantity=quantity,
+                    expires_at=expires_at,
+                ))
+
+        ProductSize.objects.bulk_update(sizes.values(), ['reserved'])
+        if crossed:
+            availability_changed(ProductSize.objects.filter(pk__in=crossed))
+        CartItem.objects.filter(pk__in=removed_items).delete()
+        CartItem.objects.bulk_update(changed_items, ['quantity'])
+        CartItem.objects.bulk_create(new_items)
+        StockReservation.objects.filter(pk__in=removed_reservations).delete()
+        StockReservation.objects.bulk_update(changed_reservations,
+                                             ['quantity', 'expires_at'])
+        StockReservation.objects.bulk_create(new_reservations)
+
+        Cart.objects.filter(pk=cart.pk).recalculate_totals()
+        cart.refresh_from_db(fields=['item_count', 'subtotal', 'updated_at'])
+        return cart
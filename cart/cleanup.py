@@ -0,0 +1,111 @@
+import time
+from datetime import timedelta
+from importlib import import_module
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import Cart, CartItem, StockReservation
+from .reservations import release_carts
+
+
+DB_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+def get_abandoned_cutoff(now=None):
+    age = getattr(settings, 'CART_ABANDONED_AFTER', settings.SESSION_COOKIE_AGE)
+    return (now or timezone.now()) - timedelta(seconds=age)
+
+
+def abandoned_carts(cutoff, now=None):
+    carts = Cart.objects.filter(user__isnull=True, updated_at__lt=cutoff)
+    if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+        carts = carts.exclude(Exists(Session.objects.filter(
+            session_key=OuterRef('session_key'),
+            expire_date__gte=now or timezone.now(),
+        )))
+    return carts
+
+
+def delete_cart_batch(cutoff, now, batch_size):
+    with transaction.atomic():
+        ids = list(abandoned_carts(cutoff, now).select_for_update(
+            skip_locked=True
+        ).order_by('updated_at').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0, 0
+        release_carts(ids)
+        items, _ = CartItem.objects.filter(cart__in=ids).delete()
+        Cart.objects.filter(pk__in=ids).delete()
+    return len(ids), items
+
+
+def delete_session_batch(now, batch_size):
+    with transaction.atomic():
+        keys = list(Session.objects.filter(
+            expire_date__lt=now
+        ).select_for_update(skip_locked=True).order_by(
+            'expire_date'
+        ).values_list('pk', flat=True)[:batch_size])
+        if keys:
+            Session.objects.filter(pk__in=keys).delete()
+    return len(keys)
+
+
+def collect_garbage(batch_size=1000, sleep=0.0, max_batches=None,
+                    dry_run=False, log=None):
+    log = log or (lambda message: None)
+    now = timezone.now()
+    cutoff = get_abandoned_cutoff(now)
+    engine = settings.SESSION_ENGINE
+    stats = {'carts': 0, 'items': 0, 'sessions': 0, 'batches': 0}
+
+    if dry_run:
+        carts = abandoned_carts(cutoff, now)
+        stats['carts'] = carts.count()
+        stats['items'] = CartItem.objects.filter(cart__in=carts).count()
+        stats['reservations'] = StockReservation.objects.filter(
+            cart__in=carts
+        ).count()
+        if engine in DB_SESSION_ENGINES:
+            stats['sessions'] = Session.objects.filter(
+                expire_date__lt=now
+            ).count()
+        return stats
+
+    start = time.monotonic()
+    steps = [('carts', lambda: delete_cart_batch(cutoff, now, batch_size))]
+    if engine in DB_SESSION_ENGINES:
+        steps.append(('sessions', lambda: (
+            delete_session_batch(now, batch_size), 0
+        )))
+
+    # max_batches applies to each step, so a large cart backlog does not
+    # starve session cleanup.
+    for name, step in steps:
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            deleted, items = step()
+            if not deleted:
+                break
+            stats[name] += deleted
+            stats['items'] += items
+            stats['batches'] += 1
+            batches += 1
+            elapsed = time.monotonic() - start
+            log(f"{name}: {stats[name]} deleted "
+                f"({stats[name] / elapsed:.0f}/s)")
+            if deleted < batch_size:
+                break
+            if sleep:
+                time.sleep(sleep)
+
+    if engine not in DB_SESSION_ENGINES:
+        import_module(engine).SessionStore.clear_expired()
+
+    stats['seconds'] = round(time.monotonic() - start, 3)
+    return stats
@@ -1,15 +1,8 @@
-from .models import Cart
+from .middleware import get_cart
 
 
 def cart_processor(request):
-    if not request.session.session_key:
-        request.session.create()
-
-    cart, created = Cart.objects.get_or_create(
-        session_key = request.session.session_key
-    )    
-
     return {
-        'cart_total_items': cart.total_items,
-        'cart_suntotal': cart.subtotal,
-    }
\ No newline at end of file
+        'cart_total_items': lambda: get_cart(request).total_items,
+        'cart_suntotal': lambda: get_cart(request).subtotal,
+    }
@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from .models import CartItem
 
 
@@ -12,15 +13,28 @@ class AddToCartForm(forms.Form):
         self.product = product
 
         if product:
-            sizes = product.product_sizes.filter(stock__gt=0)
-            if sizes.exists():
-                self.fields['size_id'] = forms.ChoiceField(
+            sizes = self.get_available_sizes()
+            if sizes:
+                self.fields['size_id'] = forms.TypedChoiceField(
                     choices=[(ps.id, ps.size.name) for ps in sizes],
+                             coerce=int,
                              required=True,
-                             initial=sizes.first().id
+                             initial=sizes[0].id
                 )
 
 
+    def get_available_sizes(self):
+        return [ps for ps in self.product.product_sizes.all() if ps.available > 0]
+
+
+    def get_product_size(self):
+        size_id = self.cleaned_data.get('size_id')
+        sizes = self.get_available_sizes()
+        if size_id:
+            return next((ps for ps in sizes if ps.id == size_id), None)
+        return sizes[0] if sizes else None
+
+
 class UpdateCartItemForm(forms.ModelForm):
     class Meta:
         model = CartItem
@@ -32,4 +46,46 @@ class UpdateCartItemForm(forms.ModelForm):
         if self.instance and self.instance.product_size:
             self.fields['quantity'].validators.append(
                 forms.validators.MaxValueValidator(self.instance.product_size.stock)
-            )                    
\ No newline at end of file
+            )
+
+
+class CartBatchForm(forms.Form):
+    OPERATIONS = ('add', 'update', 'remove')
+
+    operations = forms.JSONField()
+
+
+    def clean_operations(self):
+        operations = self.cleaned_data['operations']
+        limit = getattr(settings, 'CART_BATCH_MAX_OPERATIONS', 100)
+        if not isinstance(operations, list) or not operations:
+            raise forms.ValidationError('Expected a list of operations.')
+        if len(operations) > limit:
+            raise forms.ValidationError(f'At most {limit} operations allowed.')
+
+        cleaned = []
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict) or \
+                    operation.get('op') not in self.OPERATIONS:
+                raise forms.ValidationError(f'Operation {index}: unknown op.')
+            op = operation['op']
+            key = 'product_size' if op == 'add' else 'item'
+            if op == 'update' and 'quantity' not in operation:
+                raise forms.ValidationError(
+                    f'Operation {index}: update requires a quantity.'
+                )
+            try:
+                target = int(operation[key])
+                quantity = 0 if op == 'remove' else \
+                    int(operation.get('quantity', 1))
+            except (KeyError, TypeError, ValueError):
+                raise forms.ValidationError(
+                    f'Operation {index}: {key} and quantity must be integers.'
+                )
+            # Removing a line is always an explicit remove op.
+            if op != 'remove' and quantity < 1:
+                raise forms.ValidationError(
+                    f'Operation {index}: invalid quantity.'
+                )
+            cleaned.append({'op': op, key: target, 'quantity': quantity})
+        return cleaned
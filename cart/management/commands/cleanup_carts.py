@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand
+from cart.cleanup import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned anonymous carts and expired sessions in ' \
+           'small batches.'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to pause between batches.')
+        parser.add_argument('--max-batches', type=int,
+                            help='Stop each step (carts, sessions) after '
+                                 'this many batches per run.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count what would be deleted.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, waiting --interval seconds '
+                                 'between runs.')
+        parser.add_argument('--interval', type=int, default=300)
+
+
+    def handle(self, *args, **options):
+        while True:
+            stats = collect_garbage(
+                batch_size=options['batch_size'],
+                sleep=options['sleep'],
+                max_batches=options['max_batches'],
+                dry_run=options['dry_run'],
+                log=self.stdout.write if options['verbosity'] > 1 else None,
+            )
+            if options['dry_run']:
+                message = (
+                    f"Would delete {stats['carts']} carts, {stats['items']} "
+                    f"cart items and {stats['sessions']} sessions, and "
+                    f"release {stats['reservations']} reservations."
+                )
+            else:
+                message = (
+                    f"Deleted {stats['carts']} carts, {stats['items']} cart "
+                    f"items and {stats['sessions']} sessions."
+                )
+            self.stdout.write(self.style.SUCCESS(message))
+            if not options['loop'] or options['dry_run']:
+                break
+            time.sleep(options['interval'])
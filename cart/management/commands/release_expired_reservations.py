@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from cart.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Return stock held by expired cart reservations.'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Released {released} expired reservations.'
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from cart.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Verify the stored cart item_count/subtotal columns and repair drift.'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drifted carts, do not repair them.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        drifted = Cart.objects.with_drifted_totals().order_by('pk')
+
+        last_pk = 0
+        total = 0
+        while True:
+            ids = list(drifted.filter(pk__gt=last_pk).values_list(
+                'pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_pk = ids[-1]
+            total += len(ids)
+
+            if not options['check']:
+                with transaction.atomic():
+                    Cart.objects.filter(pk__in=ids).recalculate_totals()
+
+        if options['check']:
+            if total:
+                raise CommandError(f'{total} carts have drifted totals.')
+            self.stdout.write('All cart totals are in sync.')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Repaired totals for {total} carts.'
+            ))
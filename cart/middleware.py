@@ -1,14 +1,142 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, \
+    sync_to_async
+from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
 from .models import Cart
+import time
 
 
-class CartMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-        if not request.session.session_key:
-            request.session.create()
+def get_user_cart(request, user, create=False):
+    cart = Cart.objects.filter(user=user).first()
+    if cart is not None or not create:
+        return cart or Cart(user=user)
 
-        request.cart, crated = Cart.objects.get_or_create(
-            session_key=request.session.session_key
+    session_key = request.session.session_key
+    if session_key:
+        Cart.objects.filter(
+            session_key=session_key, user__isnull=True
+        ).update(user=user, session_key=None)
+    cart, created = Cart.objects.get_or_create(user=user)
+    request.cart = cart
+    return cart
+
+
+def anonymous_cart_queryset(session, cart_id):
+    if cart_id:
+        return Cart.objects.filter(pk=cart_id, user__isnull=True)
+    if session.session_key and \
+            not settings.SESSION_ENGINE.endswith('signed_cookies'):
+        return Cart.objects.filter(
+            session_key=session.session_key, user__isnull=True
         )
-        return None
+    return Cart.objects.none()
+
+
+def get_cart(request, create=False):
+    if not getattr(settings, 'CART_CREATE_ON_WRITE', False):
+        create = True
+
+    cart = getattr(request, '_cached_cart', None)
+    if cart is not None and (cart.pk is not None or not create):
+        return cart
+
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        cart = get_user_cart(request, user, create)
+        request._cached_cart = cart
+        return cart
+
+    session = request.session
+    cart_id = session.get('cart_id')
+    cart = anonymous_cart_queryset(session, cart_id).first()
+
+    if cart is None and create:
+        if settings.SESSION_ENGINE.endswith('signed_cookies'):
+            # Signed-cookie sessions have no stable key, the cart is
+            # found through session['cart_id'] alone.
+            cart = Cart.objects.create()
+        else:
+            if not session.session_key:
+                # A brand new session cannot have a cart yet.
+                session.create()
+                cart = Cart.objects.create(session_key=session.session_key)
+            else:
+                cart, created = Cart.objects.get_or_create(
+                    session_key=session.session_key
+                )
+        request.cart = cart
+    elif cart is None:
+        cart = Cart()
+
+    if cart.pk is not None and cart.pk != cart_id:
+        session['cart_id'] = cart.pk
+
+    request._cached_cart = cart
+    return cart
+
+
+async def aget_cart(request):
+    if not getattr(settings, 'CART_CREATE_ON_WRITE', False):
+        return await sync_to_async(get_cart)(request)
+
+    cart = getattr(request, '_cached_cart', None)
+    if cart is not None:
+        return cart
+
+    user = await request.auser()
+    if user.is_authenticated:
+        cart = await Cart.objects.filter(user=user).afirst() or Cart(user=user)
+        request._cached_cart = cart
+        return cart
+
+    session = request.session
+    cart_id = await session.aget('cart_id')
+    cart = await anonymous_cart_queryset(session, cart_id).afirst()
+
+    if cart is None:
+        cart = Cart()
+    elif cart.pk != cart_id:
+        await session.aset('cart_id', cart.pk)
+
+    request._cached_cart = cart
+    return cart
+
+
+class SessionRefreshMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        if session is None or session.is_empty():
+            return response
+
+        interval = getattr(settings, 'SESSION_REFRESH_INTERVAL', 60 * 60)
+        now = int(time.time())
+        if session.modified or \
+                now - session.get('_refreshed_at', 0) >= interval:
+            session['_refreshed_at'] = now
+        return response
+
+
+class CartMiddleware:
+    sync_capable = True
+    async_capable = True
+
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.cart = SimpleLazyObject(lambda: get_cart(request))
+        return self.get_response(request)
+
 
+    async def __acall__(self, request):
+        # Async views read the cart with aget_cart(); the lazy object is
+        # only touched from sync code such as template rendering.
+        request.cart = SimpleLazyObject(lambda: get_cart(request))
+        return await self.get_response(request)
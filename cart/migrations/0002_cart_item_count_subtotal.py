@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:03
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    items = CartItem.objects.filter(
+        cart=OuterRef('pk')
+    ).order_by().values('cart')
+    Cart.objects.update(
+        item_count=Coalesce(Subquery(
+            items.annotate(total=Sum('quantity')).values('total')
+        ), 0),
+        subtotal=Coalesce(Subquery(
+            items.annotate(total=Sum(
+                F('quantity') * F('product__price'),
+                output_field=models.DecimalField(max_digits=12,
+                                                 decimal_places=2)
+            )).values('total')
+        ), Decimal('0.00')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.RunPython(backfill_cart_totals,
+                             migrations.RunPython.noop),
+    ]
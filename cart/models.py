@@ -1,27 +1,100 @@
-from django.db import models
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.sessions.models import Session
+from django.utils import timezone
 from main.models import Product, ProductSize
 from decimal import Decimal
 
 
+def cart_totals(prefix=''):
+    return {
+        'total_items': Coalesce(Sum(f'{prefix}quantity'), 0),
+        'subtotal': Coalesce(
+            Sum(F(f'{prefix}quantity') * F(f'{prefix}product__price'),
+                output_field=models.DecimalField(max_digits=12,
+                                                 decimal_places=2)),
+            Decimal('0.00')
+        ),
+    }
+
+
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        totals = cart_totals('items__')
+        return self.annotate(
+            total_items_sum=totals['total_items'],
+            subtotal_sum=totals['subtotal'],
+        )
+    
+
+    def with_drifted_totals(self):
+        return self.with_totals().exclude(
+            item_count=F('total_items_sum'),
+            subtotal=F('subtotal_sum'),
+        )
+
+
+    def recalculate_totals(self):
+        totals = cart_totals()
+        items = CartItem.objects.filter(
+            cart=OuterRef('pk')
+        ).order_by().values('cart')
+        return self.update(
+            item_count=Coalesce(Subquery(
+                items.annotate(total=totals['total_items']).values('total')
+            ), 0),
+            subtotal=Coalesce(Subquery(
+                items.annotate(total=totals['subtotal']).values('total')
+            ), Decimal('0.00')),
+            updated_at=timezone.now(),
+        )
+
+
 class Cart(models.Model):
-    session_key = models.CharField(max_length=40, unique=True)
+    session_key = models.CharField(max_length=40, unique=True, null=True,
+                                   blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
+                             related_name='carts', on_delete=models.CASCADE)
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2,
+                                   default=Decimal('0.00'))
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user'],
+                                    condition=Q(user__isnull=False),
+                                    name='cart_unique_user'),
+        ]
+        indexes = [
+            models.Index(fields=['updated_at'],
+                         condition=Q(user__isnull=True),
+                         name='cart_anon_updated_idx'),
+        ]
+
 
     def __str__(self):
-        return f"Cart {self.session_key}"
+        return f"Cart {self.user_id or self.session_key}"
     
 
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.item_count
     
 
-    @property
-    def subtotal(self):
-        return sum(item.total_price for item in self.items.all())
+    def _apply_totals_delta(self, quantity, amount):
+        Cart.objects.filter(pk=self.pk).update(
+            item_count=F('item_count') + quantity,
+            subtotal=F('subtotal') + amount,
+            updated_at=timezone.now(),
+        )
+        self.refresh_from_db(fields=['item_count', 'subtotal', 'updated_at'])
     
 
     def add_product(self, product, product_size, quantity=1):
@@ -33,36 +106,88 @@ class Cart(models.Model):
         )
 
         if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
+            CartItem.objects.filter(pk=cart_item.pk).update(
+                quantity=F('quantity') + quantity
+            )
+            cart_item.refresh_from_db(fields=['quantity'])
 
+        self._apply_totals_delta(quantity, product.price * quantity)
         return cart_item
 
 
     def remove_item(self, item_id):
         try:
-            item = self.items.get(id=item_id)
-            item.delete()
-            return True
+            item = self.items.select_related('product').get(id=item_id)
         except CartItem.DoesNotExist:
             return False
+        
+        item.delete()
+        self._apply_totals_delta(-item.quantity, -item.total_price)
+        return True
 
 
     def update_item_quantity(self, item_id, quantity):
         try:
-            item = self.items.get(id=item_id)
-            if quantity > 0:
-                item.quantity = quantity
-                item.save()
-            else:
-                item.delete()
-            return True
+            item = self.items.select_related('product').get(id=item_id)
         except CartItem.DoesNotExist:
             return False
         
+        if quantity > 0:
+            delta = quantity - item.quantity
+            item.quantity = quantity
+            item.save(update_fields=['quantity'])
+        else:
+            delta = -item.quantity
+            item.delete()
+        self._apply_totals_delta(delta, item.product.price * delta)
+        return True
+        
+
+    def merge(self, other):
+        if other.pk is None or other.pk == self.pk:
+            return
+        
+        quote = connection.ops.quote_name
+        greatest = 'MAX' if connection.vendor == 'sqlite' else 'GREATEST'
+        items = quote(CartItem._meta.db_table)
+        reservations = quote(StockReservation._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {items} "
+                f"(cart_id, product_id, product_size_id, quantity, added_at) "
+                f"SELECT %s, product_id, product_size_id, quantity, added_at "
+                f"FROM {items} WHERE cart_id = %s "
+                f"ON CONFLICT (cart_id, product_id, product_size_id) "
+                f"DO UPDATE SET quantity = {items}.quantity + excluded.quantity",
+                [self.pk, other.pk]
+            )
+            cursor.execute(
+                f"INSERT INTO {reservations} "
+                f"(cart_id, product_size_id, quantity, expires_at) "
+                f"SELECT %s, product_size_id, quantity, expires_at "
+                f"FROM {reservations} WHERE cart_id = %s "
+                f"ON CONFLICT (cart_id, product_size_id) "
+                f"DO UPDATE SET quantity = {reservations}.quantity + "
+                f"excluded.quantity, expires_at = {greatest}("
+                f"{reservations}.expires_at, excluded.expires_at)",
+                [self.pk, other.pk]
+            )
+            other.delete()
+            Cart.objects.filter(pk=self.pk).recalculate_totals()
+        self.refresh_from_db(fields=['item_count', 'subtotal', 'updated_at'])
+
 
     def clear(self):
+        if self.pk is None:
+            return
         self.items.all().delete()
+        Cart.objects.filter(pk=self.pk).update(
+            item_count=0,
+            subtotal=Decimal('0.00'),
+            updated_at=timezone.now(),
+        )
+        self.item_count = 0
+        self.subtotal = Decimal('0.00')
 
 
 class CartItem(models.Model):
@@ -84,4 +209,24 @@ class CartItem(models.Model):
     @property
     def total_price(self):
         return Decimal(str(self.product.price)) * self.quantity
+
+
+class StockReservation(models.Model):
+    cart = models.ForeignKey(Cart, related_name='reservations',
+                             on_delete=models.CASCADE)
+    product_size = models.ForeignKey(ProductSize, related_name='reservations',
+                                     on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product_size'],
+                                    name='cart_reservation_unique'),
+        ]
+
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_size_id} for cart {self.cart_id}"
                        
\ No newline at end of file
@@ -0,0 +1,147 @@
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from main.cache import CATALOG_VERSION, bump_version
+from main.models import Product, ProductSize
+from .models import CartItem, StockReservation
+
+
+class InsufficientStock(Exception):
+    def __init__(self, available, in_cart=0):
+        self.available = available
+        self.in_cart = in_cart
+        super().__init__(f'Only {available} items available')
+
+
+    @property
+    def remaining(self):
+        return max(self.available - self.in_cart, 0)
+
+
+def get_reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'CART_RESERVATION_TTL', 15 * 60))
+
+
+def availability_changed(product_sizes):
+    # Cached pages and ETags only reflect whether a size is in stock, so
+    # products are invalidated when a size crosses zero, not on every
+    # reservation.
+    updated = Product.objects.filter(
+        product_sizes__in=product_sizes
+    ).update(updated_at=timezone.now())
+    if updated:
+        transaction.on_commit(lambda: bump_version(CATALOG_VERSION))
+    return updated
+
+
+def _release_quantities(quantities):
+    quantities = {pk: n for pk, n in quantities.items() if n}
+    if not quantities:
+        return
+    released = Case(
+        *[When(pk=pk, then=Value(n)) for pk, n in quantities.items()],
+        default=Value(0),
+    )
+    # Sizes that are sold out now and will be back in stock afterwards.
+    availability_changed(ProductSize.objects.filter(
+        pk__in=quantities,
+        stock__lte=F('reserved'),
+        stock__gt=F('reserved') - released,
+    ))
+    ProductSize.objects.filter(pk__in=quantities).update(reserved=Greatest(
+        F('reserved') - released, Value(0),
+    ))
+
+
+def _increase_reserved(product_size, delta):
+    sizes = ProductSize.objects.filter(pk=product_size.pk)
+    if sizes.filter(stock__gt=F('reserved') + delta).update(
+            reserved=F('reserved') + delta):
+        return True
+    # Taking exactly the last items sells the size out.
+    if sizes.filter(stock=F('reserved') + delta).update(
+            reserved=F('reserved') + delta):
+        availability_changed(sizes)
+        return True
+    return False
+
+
+def reserve(cart, product_size, quantity, increment=False):
+    with transaction.atomic():
+        reservation, _ = StockReservation.objects.select_for_update() \
+            .get_or_create(
+                cart=cart,
+                product_size=product_size,
+                defaults={'quantity': 0, 'expires_at': timezone.now()},
+            )
+
+        in_cart = 0
+        if increment:
+            in_cart = CartItem.objects.filter(
+                cart=cart, product_size=product_size
+            ).values_list('quantity', flat=True).first() or 0
+            quantity += in_cart
+
+        delta = quantity - reservation.quantity
+        if delta > 0:
+            if not _increase_reserved(product_size, delta):
+                product_size.refresh_from_db(fields=['stock', 'reserved'])
+                available = product_size.stock - product_size.reserved \
+                    + reservation.quantity
+                raise InsufficientStock(max(available, 0), in_cart)
+        elif delta < 0:
+            _release_quantities({product_size.pk: -delta})
+
+        if quantity > 0:
+            reservation.quantity = quantity
+            reservation.expires_at = timezone.now() + get_reservation_ttl()
+            reservation.save(update_fields=['quantity', 'expires_at'])
+        else:
+            reservation.delete()
+        return reservation
+
+
+def _release(reservations):
+    quantities = Counter()
+    pks = []
+    for pk, product_size_id, quantity in reservations.values_list(
+            'pk', 'product_size_id', 'quantity'):
+        quantities[product_size_id] += quantity
+        pks.append(pk)
+
+    _release_quantities(quantities)
+    StockReservation.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def release(cart, product_size=None):
+    with transaction.atomic():
+        reservations = StockReservation.objects.select_for_update() \
+            .filter(cart=cart)
+        if product_size is not None:
+            reservations = reservations.filter(product_size=product_size)
+        return _release(reservations)
+
+
+def release_carts(cart_ids):
+    with transaction.atomic():
+        return _release(StockReservation.objects.select_for_update().filter(
+            cart__in=cart_ids
+        ))
+
+
+def release_expired(batch_size=500, now=None):
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            count = _release(StockReservation.objects.select_for_update(
+                skip_locked=True
+            ).filter(expires_at__lte=now).order_by('pk')[:batch_size])
+        if not count:
+            return released
+        released += count
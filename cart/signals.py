@@ -0,0 +1,31 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from .models import Cart
+
+
+@receiver(user_logged_in)
+def merge_session_cart(sender, request, user, **kwargs):
+    if request is None or not hasattr(request, 'session'):
+        return
+
+    cart_id = request.session.get('cart_id')
+    session_cart = Cart.objects.filter(
+        pk=cart_id, user__isnull=True
+    ).first() if cart_id else None
+
+    cart = Cart.objects.filter(user=user).first()
+    if session_cart is None:
+        if cart is None:
+            return
+    elif cart is None:
+        session_cart.user = user
+        session_cart.session_key = None
+        session_cart.save(update_fields=['user', 'session_key', 'updated_at'])
+        cart = session_cart
+    else:
+        cart.merge(session_cart)
+
+    if cart.pk != cart_id:
+        request.session['cart_id'] = cart.pk
+    request._cached_cart = cart
+    request.cart = cart
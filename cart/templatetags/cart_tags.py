@@ -1,5 +1,5 @@
 from django import template
-from cart.models import Cart
+from cart.middleware import get_cart
 
 
 register = template.Library()
@@ -7,15 +7,10 @@ register = template.Library()
 
 @register.simple_tag(takes_context=True)
 def get_cart_count(context):
-    request = context['request']
-    if not request.session.session_key:
-        return 0
-    
-    try:
-        cart = Cart.objects.get(session_key=request.session.session_key)
-        return cart.total_items
-    except Cart.DoesNotExist:
+    request = context.get('request')
+    if request is None:
         return 0
+    return get_cart(request).total_items
     
 
 @register.filter
@@ -1,3 +1,462 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from main.cache import CATALOG_VERSION, get_version
+from main.models import Category, Product, ProductSize, Size
+from .batch import BatchError, apply_operations
+from .cleanup import collect_garbage
+from .forms import CartBatchForm
+from .models import Cart, CartItem, StockReservation
+from .reservations import InsufficientStock, release, release_expired, \
+    reserve
 
-# Create your tests here.
+
+def make_product(name='Shirt', price='10.00', stock=5, category=None):
+    category = category or Category.objects.get_or_create(
+        slug='tops', defaults={'name': 'Tops'}
+    )[0]
+    product = Product.objects.create(name=name, category=category,
+                                     color='black', price=Decimal(price))
+    size = Size.objects.get_or_create(name='M')[0]
+    product_size = ProductSize.objects.create(product=product, size=size,
+                                              stock=stock)
+    return product, product_size
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.product, self.size = make_product(stock=5)
+        self.cart = Cart.objects.create(session_key='a')
+        self.other_cart = Cart.objects.create(session_key='b')
+
+
+    def assertReserved(self, reserved):
+        self.size.refresh_from_db()
+        self.assertEqual(self.size.reserved, reserved)
+
+
+    def test_reserve_holds_stock(self):
+        reserve(self.cart, self.size, 2)
+
+        self.assertReserved(2)
+        self.assertEqual(self.size.available, 3)
+        self.assertEqual(
+            StockReservation.objects.get(cart=self.cart).quantity, 2
+        )
+
+
+    def test_other_cart_cannot_oversell(self):
+        reserve(self.cart, self.size, 4)
+
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve(self.other_cart, self.size, 2)
+
+        self.assertEqual(raised.exception.available, 1)
+        self.assertEqual(str(raised.exception), 'Only 1 items available')
+        self.assertReserved(4)
+        self.assertFalse(
+            StockReservation.objects.filter(cart=self.other_cart).exists()
+        )
+
+
+    def test_increment_counts_quantity_in_cart(self):
+        reserve(self.cart, self.size, 3)
+        self.cart.add_product(self.product, self.size, 3)
+
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve(self.cart, self.size, 3, increment=True)
+
+        self.assertEqual(raised.exception.in_cart, 3)
+        self.assertEqual(raised.exception.remaining, 2)
+        self.assertReserved(3)
+
+
+    def test_lower_quantity_releases_difference(self):
+        reserve(self.cart, self.size, 4)
+        reserve(self.cart, self.size, 1)
+        self.assertReserved(1)
+
+        reserve(self.cart, self.size, 0)
+        self.assertReserved(0)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+    def test_release(self):
+        other, other_size = make_product('Pants', stock=3)
+        reserve(self.cart, self.size, 2)
+        reserve(self.cart, other_size, 1)
+
+        self.assertEqual(release(self.cart, self.size), 1)
+        self.assertReserved(0)
+        self.assertEqual(release(self.cart), 1)
+        other_size.refresh_from_db()
+        self.assertEqual(other_size.reserved, 0)
+
+
+    def test_release_expired(self):
+        reserve(self.cart, self.size, 2)
+        reserve(self.other_cart, self.size, 1)
+        StockReservation.objects.filter(cart=self.cart).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertEqual(release_expired(), 1)
+        self.assertReserved(1)
+        self.assertEqual(StockReservation.objects.get().cart, self.other_cart)
+
+
+    def test_selling_out_invalidates_catalog(self):
+        version = get_version(CATALOG_VERSION)
+        reserve(self.cart, self.size, 4)
+        self.assertEqual(get_version(CATALOG_VERSION), version)
+
+        updated_at = Product.objects.get().updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve(self.cart, self.size, 5)
+        self.assertNotEqual(get_version(CATALOG_VERSION), version)
+        self.assertGreater(Product.objects.get().updated_at, updated_at)
+
+        version = get_version(CATALOG_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            release(self.cart)
+        self.assertNotEqual(get_version(CATALOG_VERSION), version)
+
+
+class AddToCartViewTests(TestCase):
+    def setUp(self):
+        self.product, self.size = make_product(stock=2)
+        self.url = reverse('cart:add_to_cart', args=[self.product.slug])
+
+
+    def test_add_reserves_and_rejects_oversell(self):
+        response = self.client.post(self.url, {'size_id': self.size.pk,
+                                               'quantity': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_items'], 2)
+
+        response = self.client.post(self.url, {'size_id': self.size.pk,
+                                               'quantity': 1})
+        self.assertEqual(response.status_code, 400)
+        self.size.refresh_from_db()
+        self.assertEqual(self.size.reserved, 2)
+
+
+    def test_remove_releases_reservation(self):
+        self.client.post(self.url, {'size_id': self.size.pk, 'quantity': 1})
+        item = CartItem.objects.get()
+
+        self.client.post(reverse('cart:remove_item', args=[item.pk]))
+
+        self.size.refresh_from_db()
+        self.assertEqual(self.size.reserved, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class AsyncCartCountTests(TestCase):
+    def setUp(self):
+        self.product, self.size = make_product(stock=5)
+        self.url = reverse('cart:cart_count')
+
+
+    async def test_anonymous_without_cart(self):
+        response = await self.async_client.get(self.url)
+
+        self.assertEqual(response.json(), {'total_items': 0, 'subtotal': 0.0})
+        self.assertFalse(await Cart.objects.aexists())
+
+
+    async def test_session_cart(self):
+        await self.async_client.post(
+            reverse('cart:add_to_cart', args=[self.product.slug]),
+            {'size_id': self.size.pk, 'quantity': 2},
+        )
+
+        response = await self.async_client.get(self.url)
+
+        self.assertEqual(response.json(),
+                         {'total_items': 2, 'subtotal': 20.0})
+
+
+    async def test_user_cart(self):
+        user = await get_user_model().objects.acreate(
+            email='user@example.com'
+        )
+        cart = await Cart.objects.acreate(user=user)
+        await sync_to_async(cart.add_product)(self.product, self.size, 3)
+        await self.async_client.aforce_login(user)
+
+        response = await self.async_client.get(self.url)
+
+        self.assertEqual(response.json()['total_items'], 3)
+
+
+class SessionWriteTests(TestCase):
+    read_only = ('main:index', 'main:catalog_all', 'cart:cart_count',
+                 'cart:cart_modal')
+
+
+    def setUp(self):
+        self.product, self.size = make_product(stock=5)
+
+
+    def browse(self):
+        urls = [reverse(name) for name in self.read_only]
+        urls.append(reverse('main:product_detail', args=[self.product.slug]))
+        with CaptureQueriesContext(connection) as queries:
+            for url in urls:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn(settings.SESSION_COOKIE_NAME,
+                                 response.cookies)
+        return [
+            query['sql'] for query in queries
+            if 'django_session' in query['sql'] and
+            not query['sql'].startswith('SELECT')
+        ]
+
+
+    def test_anonymous_browsing_creates_no_session(self):
+        self.assertEqual(self.browse(), [])
+        self.assertFalse(Session.objects.exists())
+        self.assertFalse(Cart.objects.exists())
+
+
+    def test_browsing_with_a_cart_does_not_save_the_session(self):
+        self.client.post(reverse('cart:add_to_cart',
+                                 args=[self.product.slug]),
+                         {'size_id': self.size.pk, 'quantity': 1})
+
+        self.assertEqual(self.browse(), [])
+
+
+    @override_settings(SESSION_REFRESH_INTERVAL=0)
+    def test_session_expiry_slides_once_the_interval_passes(self):
+        self.client.post(reverse('cart:add_to_cart',
+                                 args=[self.product.slug]),
+                         {'size_id': self.size.pk, 'quantity': 1})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('cart:cart_count'))
+
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertTrue(any('django_session' in query['sql'] and
+                            not query['sql'].startswith('SELECT')
+                            for query in queries))
+
+
+class BatchOperationTests(TestCase):
+    def setUp(self):
+        self.shirt, self.shirt_size = make_product('Shirt', '10.00', stock=5)
+        self.pants, self.pants_size = make_product('Pants', '25.00', stock=3)
+        self.hat, self.hat_size = make_product('Hat', '5.00', stock=2)
+        self.cart = Cart.objects.create(session_key='a')
+        self.shirt_item = self.add(self.shirt, self.shirt_size, 2)
+        self.pants_item = self.add(self.pants, self.pants_size, 1)
+
+
+    def add(self, product, product_size, quantity):
+        reserve(self.cart, product_size, quantity)
+        return self.cart.add_product(product, product_size, quantity)
+
+
+    def snapshot(self):
+        return (
+            sorted(CartItem.objects.values_list('product_size', 'quantity')),
+            sorted(StockReservation.objects.values_list('product_size',
+                                                        'quantity')),
+            sorted(ProductSize.objects.values_list('pk', 'reserved')),
+        )
+
+
+    def test_mixed_batch(self):
+        cart = apply_operations(self.cart, [
+            {'op': 'add', 'product_size': self.hat_size.pk, 'quantity': 2},
+            {'op': 'update', 'item': self.shirt_item.pk, 'quantity': 4},
+            {'op': 'remove', 'item': self.pants_item.pk, 'quantity': 0},
+        ])
+
+        self.assertEqual(
+            sorted(cart.items.values_list('product_size', 'quantity')),
+            sorted([(self.shirt_size.pk, 4), (self.hat_size.pk, 2)]),
+        )
+        self.assertEqual(cart.item_count, 6)
+        self.assertEqual(cart.subtotal, Decimal('50.00'))
+        self.assertEqual(
+            dict(ProductSize.objects.values_list('pk', 'reserved')),
+            {self.shirt_size.pk: 4, self.pants_size.pk: 0,
+             self.hat_size.pk: 2},
+        )
+
+
+    def test_failing_operation_rejects_whole_batch(self):
+        before = self.snapshot()
+
+        with self.assertRaises(BatchError) as raised:
+            apply_operations(self.cart, [
+                {'op': 'add', 'product_size': self.hat_size.pk,
+                 'quantity': 1},
+                {'op': 'update', 'item': self.pants_item.pk, 'quantity': 4},
+            ])
+
+        self.assertEqual(raised.exception.errors,
+                         ['Pants (M): only 3 items available'])
+        self.assertEqual(self.snapshot(), before)
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.item_count, self.cart.subtotal),
+                         (3, Decimal('45.00')))
+
+
+    def test_unknown_item_rejects_whole_batch(self):
+        before = self.snapshot()
+
+        with self.assertRaises(BatchError):
+            apply_operations(self.cart, [
+                {'op': 'remove', 'item': self.shirt_item.pk, 'quantity': 0},
+                {'op': 'remove', 'item': 0, 'quantity': 0},
+            ])
+
+        self.assertEqual(self.snapshot(), before)
+
+
+    def test_update_requires_quantity(self):
+        form = CartBatchForm({'operations': '[{"op": "update", "item": 1}]'})
+        self.assertFalse(form.is_valid())
+
+        form = CartBatchForm(
+            {'operations': '[{"op": "update", "item": 1, "quantity": 0}]'}
+        )
+        self.assertFalse(form.is_valid())
+
+        form = CartBatchForm({'operations': '[{"op": "remove", "item": 1}]'})
+        self.assertTrue(form.is_valid())
+
+
+class CartMergeTests(TestCase):
+    def setUp(self):
+        self.shirt, self.shirt_size = make_product('Shirt', '10.00', stock=5)
+        self.pants, self.pants_size = make_product('Pants', '25.00', stock=3)
+        self.user = get_user_model().objects.create(email='user@example.com')
+
+
+    def add(self, cart, product, product_size, quantity):
+        reserve(cart, product_size, quantity, increment=True)
+        return cart.add_product(product, product_size, quantity)
+
+
+    def add_to_session_cart(self, product, product_size, quantity):
+        self.client.post(reverse('cart:add_to_cart', args=[product.slug]),
+                         {'size_id': product_size.pk, 'quantity': quantity})
+        return Cart.objects.get(user__isnull=True)
+
+
+    def test_merge_into_empty_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        other = Cart.objects.create(session_key='a')
+        self.add(other, self.shirt, self.shirt_size, 2)
+
+        cart.merge(other)
+
+        self.assertEqual(list(cart.items.values_list('product_size',
+                                                     'quantity')),
+                         [(self.shirt_size.pk, 2)])
+        self.assertEqual(StockReservation.objects.get().cart, cart)
+        self.assertEqual((cart.item_count, cart.subtotal),
+                         (2, Decimal('20.00')))
+        self.assertFalse(Cart.objects.filter(pk=other.pk).exists())
+
+
+    def test_merge_sums_quantities_and_reservations(self):
+        cart = Cart.objects.create(user=self.user)
+        self.add(cart, self.shirt, self.shirt_size, 1)
+        other = Cart.objects.create(session_key='a')
+        self.add(other, self.shirt, self.shirt_size, 2)
+        self.add(other, self.pants, self.pants_size, 1)
+
+        cart.merge(other)
+
+        self.assertEqual(
+            sorted(cart.items.values_list('product_size', 'quantity')),
+            sorted([(self.shirt_size.pk, 3), (self.pants_size.pk, 1)]),
+        )
+        self.assertEqual(
+            sorted(StockReservation.objects.filter(cart=cart)
+                   .values_list('product_size', 'quantity')),
+            sorted([(self.shirt_size.pk, 3), (self.pants_size.pk, 1)]),
+        )
+        self.assertEqual((cart.item_count, cart.subtotal),
+                         (4, Decimal('55.00')))
+        self.assertEqual(Cart.objects.count(), 1)
+        self.shirt_size.refresh_from_db()
+        self.assertEqual(self.shirt_size.reserved, 3)
+
+
+    def test_login_adopts_session_cart(self):
+        session_cart = self.add_to_session_cart(self.shirt,
+                                                self.shirt_size, 2)
+
+        self.client.force_login(self.user)
+
+        cart = Cart.objects.get()
+        self.assertEqual(cart.pk, session_cart.pk)
+        self.assertEqual(cart.user, self.user)
+        self.assertIsNone(cart.session_key)
+        self.assertEqual(self.client.session['cart_id'], cart.pk)
+
+
+    def test_login_merges_session_cart_into_user_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        self.add(cart, self.shirt, self.shirt_size, 1)
+        self.add_to_session_cart(self.shirt, self.shirt_size, 2)
+
+        self.client.force_login(self.user)
+
+        cart = Cart.objects.get()
+        self.assertEqual(cart.user, self.user)
+        self.assertEqual(cart.items.get().quantity, 3)
+        self.assertEqual(cart.item_count, 3)
+
+
+    def test_login_without_session_cart_stays_lazy(self):
+        self.client.get(reverse('cart:cart_count'))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('cart:cart_count'))
+
+        self.assertEqual(response.json()['total_items'], 0)
+        self.assertFalse(Cart.objects.exists())
+
+
+class CleanupTests(TestCase):
+    def setUp(self):
+        old = timezone.now() - timedelta(days=365)
+        for key in ('a', 'b', 'c'):
+            Cart.objects.create(session_key=key)
+            Session.objects.create(session_key=f'expired-{key}',
+                                   session_data='', expire_date=old)
+        Cart.objects.update(updated_at=old)
+
+
+    def test_max_batches_applies_to_each_step(self):
+        stats = collect_garbage(batch_size=1, max_batches=2)
+
+        self.assertEqual((stats['carts'], stats['sessions']), (2, 2))
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(Session.objects.count(), 1)
+
+
+    def test_dry_run_counts_reservations(self):
+        _, product_size = make_product()
+        reserve(Cart.objects.first(), product_size, 2)
+        Cart.objects.update(updated_at=timezone.now() - timedelta(days=365))
+
+        stats = collect_garbage(dry_run=True)
+
+        self.assertEqual((stats['carts'], stats['reservations']), (3, 1))
+        self.assertEqual(Cart.objects.count(), 3)
@@ -1,50 +1,52 @@
 from django.shortcuts import get_object_or_404, redirect
 from django.views.generic import View
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, Http404
 from django.template.response import TemplateResponse
 from django.contrib import messages
 from django.db import transaction
-from main.models import Product, ProductSize
-from .models import Cart, CartItem
-from .forms import AddToCartForm
+from django.utils.decorators import method_decorator
+from main.models import Product
+from .models import CartItem
+from .batch import BatchError, apply_operations
+from .forms import AddToCartForm, CartBatchForm
+from .middleware import aget_cart, get_cart
+from .reservations import InsufficientStock, release, reserve
 import json
 
 
 class CartMixin:
-    def get_cart(self, request):
-        if hasattr(request, 'cart'):
-            return request.cart
+    def get_cart(self, request, create=False):
+        return get_cart(request, create=create)
     
-        if not request.session.session_key:
-            request.session.create()
 
-        cart, created = Cart.objects.get_or_create(
-            session_key=request.session.session_key
-        )
+    def get_cart_items(self, cart):
+        if cart.pk is None:
+            return CartItem.objects.none()
+        return cart.items.select_related(
+            'product',
+            'product_size__size'
+        ).order_by('-added_at')
+    
 
-        request.session['cart_id'] = cart.id
-        request.session.modified = True
-        return cart
+    def get_cart_context(self, cart):
+        return {
+            'cart': cart,
+            'cart_items': self.get_cart_items(cart),
+        }
     
 
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class CartModalView(CartMixin, View):
     def get(self, request):
         cart = self.get_cart(request)
-        context = {
-            'cart': cart,
-            'cart_items': cart.items.select_related(
-                'product',
-                'product_size__size'
-            ).order_by('-added_at')
-        }
+        context = self.get_cart_context(cart)
         return TemplateResponse(request, 'cart/cart_modal.html', context)
 
 
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class AddToCartView(CartMixin, View):
-    @transaction.atomic
     def post(self, request, slug):
-        cart = self.get_cart(request)
-        product = get_object_or_404(Product, slug=slug)
+        product = get_object_or_404(Product.objects.with_sizes(), slug=slug)
 
         form = AddToCartForm(request.POST, product=product)
 
@@ -54,42 +56,31 @@ class AddToCartView(CartMixin, View):
                 'errors': form.errors,
             }, status=400)
         
-        size_id = form.cleaned_data.get('size_id')
-        if size_id:
-            product_size = get_object_or_404(
-                ProductSize,
-                id=size_id,
-                product=product
-            )
-        else:
-            product_size = product.product_sizes.filter(stock__gt=0).first()
-            if not product_size:
-                return JsonResponse({
-                    'error': 'No sizes available'
-                }, status=400)
+        product_size = form.get_product_size()
+        if not product_size:
+            return JsonResponse({
+                'error': 'No sizes available'
+            }, status=400)
 
         quantity = form.cleaned_data['quantity']
-        if product_size.stock < quantity:
+        if product_size.available < quantity:
             return JsonResponse({
-                'error': f'Only {product_size.stock} items available'
+                'error': f'Only {product_size.available} items available'
             }, status=400)
 
-        existing_item = cart.items.filter(
-            product=product,
-            product_size=product_size,
-        ).first()
-
-        if existing_item:
-            total_quantity = existing_item.quantity + quantity
-            if total_quantity > product_size.stock:
+        cart = self.get_cart(request, create=True)
+        try:
+            with transaction.atomic():
+                reserve(cart, product_size, quantity, increment=True)
+                cart_item = cart.add_product(product, product_size, quantity)
+        except InsufficientStock as e:
+            if e.in_cart:
                 return JsonResponse({
-                    'error': f"Cannot add {quantity} items. Only {product_size.stock - existing_item.quantity} more available."
+                    'error': f"Cannot add {quantity} items. Only {e.remaining} more available."
                 }, status=400)
-            
-        cart_item = cart.add_product(product, product_size, quantity)
-
-        request.session['cart_id'] = cart.id
-        request.session.modified = True
+            return JsonResponse({
+                'error': f'Only {e.available} items available'
+            }, status=400)
 
         if request.headers.get('HX-Request'):
             return redirect('cart:cart_modal')
@@ -102,80 +93,112 @@ class AddToCartView(CartMixin, View):
             })
         
 
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class UpdateCartItemView(CartMixin, View):
-    @transaction.atomic
     def post(self, request, item_id):
         cart = self.get_cart(request)
-        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        if cart.pk is None:
+            raise Http404('Cart is empty')
+        cart_item = get_object_or_404(
+            CartItem.objects.select_related('product_size'),
+            id=item_id, cart=cart
+        )
 
         quantity = int(request.POST.get('quantity', 1))
 
         if quantity < 0:
             return JsonResponse({'error': 'Invalid quantity'}, status=400)
         
-        if quantity == 0:
-            cart_item.delete()
-        else:
-            if quantity > cart_item.product_size.stock:
-                return JsonResponse({
-                    'error': f'Only {cart_item.product_size.stock} items available'
-                }, status=400)
-            
-            cart_item.quantity = quantity
-            cart_item.save()
+        if quantity > cart_item.product_size.stock:
+            return JsonResponse({
+                'error': f'Only {cart_item.product_size.stock} items available'
+            }, status=400)
 
-        request.session['cart_id'] = cart.id
-        request.session.modified = True
+        try:
+            with transaction.atomic():
+                reserve(cart, cart_item.product_size, quantity)
+                cart.update_item_quantity(cart_item.id, quantity)
+        except InsufficientStock as e:
+            return JsonResponse({
+                'error': f'Only {e.available} items available'
+            }, status=400)
 
-        context = {
-            'cart': cart,
-            'cart_items': cart.items.select_related(
-                'product',
-                'product_size__size',
-            ).order_by('-added_at')
-        }
+        context = self.get_cart_context(cart)
         return TemplateResponse(request, 'cart/cart_modal.html', context)
     
 
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class RemoveCartItemView(CartMixin, View):
     def post(self, request, item_id):
         cart = self.get_cart(request)
-
-        try:
-            cart_item = cart.items.get(id=item_id)
-            cart_item.delete()
-
-            request.session['cart_id'] = cart.id
-            request.session.modified = True
-
-            context = {
-                'cart': cart,
-                'cart_items': cart.items.select_related(
-                    'product',
-                    'product_size__size',
-                ).order_by('-added_at')
-            }
-            return TemplateResponse(request, 'cart/cart_modal.html', context)
-        except CartItem.DoesNotExist:
+        if cart.pk is None:
             return JsonResponse({'error': 'Item not found'}, status=400)
+
+        product_size_id = cart.items.filter(id=item_id).values_list(
+            'product_size', flat=True
+        ).first()
+        with transaction.atomic():
+            if product_size_id is None or not cart.remove_item(item_id):
+                return JsonResponse({'error': 'Item not found'}, status=400)
+            release(cart, product_size_id)
+
+        context = self.get_cart_context(cart)
+        return TemplateResponse(request, 'cart/cart_modal.html', context)
         
     
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class BatchCartView(CartMixin, View):
+    def get_form_data(self, request):
+        if request.content_type != 'application/json':
+            return request.POST
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return {}
+        if isinstance(payload, dict):
+            payload = payload.get('operations')
+        return {'operations': json.dumps(payload)}
+
+
+    def post(self, request):
+        form = CartBatchForm(self.get_form_data(request))
+        if not form.is_valid():
+            return JsonResponse({
+                'error': 'Invalid form data',
+                'errors': form.errors,
+            }, status=400)
+
+        cart = self.get_cart(request, create=True)
+        try:
+            apply_operations(cart, form.cleaned_data['operations'])
+        except BatchError as e:
+            return JsonResponse({
+                'error': 'Cart was not changed',
+                'errors': e.errors,
+            }, status=400)
+
+        context = self.get_cart_context(cart)
+        return TemplateResponse(request, 'cart/cart_modal.html', context)
+
+
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class CartCountView(CartMixin, View):
-    def get(self, request):
-        cart = self.get_cart(request)
+    async def get(self, request):
+        cart = await aget_cart(request)
         return JsonResponse({
             'total_items': cart.total_items,
             'subtotal': float(cart.subtotal)
         })
     
 
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class ClearCartView(CartMixin, View):
     def post(self, request):
         cart = self.get_cart(request)
-        cart.clear()
-
-        request.session['cart_id'] = cart.id
-        request.session.modified = True
+        if cart.pk is not None:
+            with transaction.atomic():
+                release(cart)
+                cart.clear()
 
         if request.headers.get('HX-Request'):
             return TemplateResponse(request, 'cart/cart_empty.html', {
@@ -187,14 +210,9 @@ class ClearCartView(CartMixin, View):
         })
 
 
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class CartSummaryView(CartMixin, View):
     def get(self, request):
         cart = self.get_cart(request)
-        context = {
-            'cart': cart,
-            'cart_items': cart.items.select_related(
-                'product',
-                'product_size__size'
-            ).order_by('-added_at')
-        }
+        context = self.get_cart_context(cart)
         return TemplateResponse(request, 'cart/cart_summary.html', context)
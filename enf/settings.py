@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'cart.middleware.SessionRefreshMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -61,6 +62,29 @@ MIDDLEWARE = [
     'cart.middleware.CartMiddleware',
 ]
 
+# Query budgets
+# Opt-in per-request query recording; violations are logged, and raise
+# with QUERY_BUDGET_RAISE=True (set it in CI). Tests using
+# QueryBudgetTestMixin always raise.
+
+QUERY_BUDGET_RAISE = os.getenv('QUERY_BUDGET_RAISE', 'False') == 'True'
+if os.getenv('QUERY_BUDGET', 'False') == 'True' or QUERY_BUDGET_RAISE:
+    MIDDLEWARE.insert(0, 'main.querybudget.QueryBudgetMiddleware')
+
+QUERY_BUDGETS = {
+    'main:index': 2,
+    'main:catalog': 4,
+    'main:catalog_all': 4,
+    'main:product_detail': 7,
+    'cart:cart_count': 3,
+    'cart:cart_modal': 5,
+    'cart:add_to_cart': 19,
+    'cart:update_item': 13,
+    'cart:remove_item': 12,
+    'cart:batch': 20,
+}
+QUERY_BUDGET_REPEAT_THRESHOLD = 3
+
 ROOT_URLCONF = 'enf.urls'
 
 TEMPLATES = [
@@ -98,6 +122,55 @@ DATABASES = {
     }
 }
 
+# POSTGRES_POOL=True hands connections out from psycopg's pool (requires
+# psycopg[pool]); use it under ASGI. Otherwise connections close after each
+# request; POSTGRES_CONN_MAX_AGE keeps them open for that many seconds,
+# which only suits WSGI since async views run on per-request threads that
+# would leave their persistent connections behind.
+if os.getenv('POSTGRES_POOL', 'False') == 'True':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('POSTGRES_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('POSTGRES_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.getenv('POSTGRES_POOL_TIMEOUT', '10')),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = \
+        int(os.getenv('POSTGRES_CONN_MAX_AGE', '0'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    # Process-local, only for development or a single worker: the catalog
+    # version stamps must be shared (see the main.E001 deploy check).
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+CATEGORY_CACHE_TIMEOUT = 60 * 60 * 24
+FACET_CACHE_TIMEOUT = 60 * 10
+RESPONSE_CACHE_TIMEOUT = 60 * 5
+
+# Answer catalog filters from an in-process snapshot instead of Postgres.
+CATALOG_MEMORY_INDEX = os.getenv('CATALOG_MEMORY_INDEX', 'False') == 'True'
+
+# Bearer token for the warehouse stock sync endpoint; unset disables it.
+STOCK_SYNC_TOKEN = os.getenv('STOCK_SYNC_TOKEN')
+STOCK_SYNC_CHUNK_SIZE = 1000
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -139,12 +212,24 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_RENDITION_WIDTHS = (320, 640, 960, 1280)
+IMAGE_RENDITIONS_ASYNC = True
+IMAGE_RENDITION_WORKERS = 2
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SESSION_COOKIE_AGE = 86400 # 30 ДНЕЙ
-SESSION_SAVE_EVERY_REQUEST = True  
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_ENGINE = os.getenv('SESSION_ENGINE',
+                           'django.contrib.sessions.backends.cached_db')
+SESSION_REFRESH_INTERVAL = 60 * 60
+
+CART_CREATE_ON_WRITE = True
+CART_RESERVATION_TTL = 60 * 15
+CART_BATCH_MAX_OPERATIONS = 100
+CART_ABANDONED_AFTER = SESSION_COOKIE_AGE
 
 AUTH_USER_MODEL = 'users.CustomUser'
@@ -13,6 +13,10 @@ class ProductSizeInline(admin.TabularInline):
     extra = 1
 
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('size', 'product')
+
+
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'color', 'price']
     list_filter = ['category', 'color']
@@ -0,0 +1,277 @@
+import gc
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from cart.models import Cart, CartItem
+from .cache import CATALOG_VERSION, bump_version
+from .catalog_io import chunked
+from .models import Category, Product, ProductImage, ProductSize, Size
+from .querybudget import record_queries
+from .search import get_search_backend
+from .views import CatalogView
+
+
+BENCH_PREFIX = 'bench-'
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+COLORS = ['black', 'white', 'grey', 'navy', 'beige', 'olive', 'brown', 'red']
+SIZES = ['XS', 'S', 'M', 'L', 'XL']
+WORDS = ['cotton', 'linen', 'wool', 'oversized', 'cropped', 'basic',
+         'striped', 'heavy', 'relaxed', 'vintage']
+HX = {'HTTP_HX_REQUEST': 'true'}
+
+
+def clear_benchmark_data():
+    Cart.objects.filter(session_key__startswith=BENCH_PREFIX).delete()
+    Product.objects.filter(slug__startswith=BENCH_PREFIX).delete()
+    Category.objects.filter(slug__startswith=BENCH_PREFIX).delete()
+
+
+def generate_catalog(products, categories=10, images=2, carts=1000,
+                     items_per_cart=3, batch_size=5000, seed=0, log=None):
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+
+    category_objs = Category.objects.bulk_create([
+        Category(name=f'Bench {n}', slug=f'{BENCH_PREFIX}{n}')
+        for n in range(categories)
+    ])
+    sizes = [Size.objects.get_or_create(name=name)[0] for name in SIZES]
+
+    def make_product(n):
+        words = rng.sample(WORDS, 2)
+        return Product(
+            name=f'{words[0].title()} {words[1]} tee {n}',
+            slug=f'{BENCH_PREFIX}{n}',
+            category=rng.choice(category_objs),
+            color=rng.choice(COLORS),
+            price=Decimal(rng.randint(1000, 20000)) / 100,
+            description=' '.join(rng.choices(WORDS, k=12)),
+            main_image=f'products/main/{BENCH_PREFIX}{n}.jpg',
+        )
+
+    created = 0
+    for chunk in chunked(map(make_product, range(products)), batch_size):
+        with transaction.atomic():
+            chunk = Product.objects.bulk_create(chunk)
+            ProductSize.objects.bulk_create([
+                ProductSize(product=product, size=size,
+                            stock=rng.choice([0, 5, 50, 500]))
+                for product in chunk for size in sizes
+            ])
+            ProductImage.objects.bulk_create([
+                ProductImage(product=product,
+                             image=f'products/extra/{product.slug}-{i}.jpg')
+                for product in chunk for i in range(images)
+            ])
+        created += len(chunk)
+        log(f'{created}/{products} products')
+
+    get_search_backend().update_index(
+        Product.objects.filter(slug__startswith=BENCH_PREFIX)
+    )
+
+    product_ids = list(Product.objects.filter(
+        slug__startswith=BENCH_PREFIX
+    ).values_list('pk', flat=True))
+    for chunk in chunked(range(carts), batch_size):
+        with transaction.atomic():
+            cart_objs = Cart.objects.bulk_create([
+                Cart(session_key=f'{BENCH_PREFIX}{n}') for n in chunk
+            ])
+            picks = {
+                cart.pk: rng.sample(product_ids,
+                                    min(items_per_cart, len(product_ids)))
+                for cart in cart_objs
+            }
+            size_ids = dict(ProductSize.objects.filter(
+                product_id__in={pk for pks in picks.values() for pk in pks}
+            ).order_by('-pk').values_list('product_id', 'pk'))
+            items = [
+                CartItem(cart=cart, product_id=product_id,
+                         product_size_id=size_ids[product_id],
+                         quantity=rng.randint(1, 3))
+                for cart in cart_objs for product_id in picks[cart.pk]
+            ]
+            CartItem.objects.bulk_create(items, batch_size=batch_size)
+            Cart.objects.filter(pk__in=[c.pk for c in cart_objs]) \
+                .recalculate_totals()
+        log(f'{chunk[-1] + 1}/{carts} carts')
+
+    bump_version(CATALOG_VERSION)
+    return created
+
+
+class Scenario:
+    def __init__(self, name, method, url, data=None, headers=None):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.data = data
+        self.headers = headers or {}
+
+
+    def __call__(self, client):
+        if callable(self.url):
+            url, data = self.url()
+        else:
+            url, data = self.url, self.data
+        return getattr(client, self.method)(url, data, **self.headers)
+
+
+def build_scenarios(seed=0):
+    rng = random.Random(seed)
+    products = Product.objects.filter(
+        slug__startswith=BENCH_PREFIX
+    ).order_by('-pk')
+    product = products.first()
+    if product is None:
+        raise ValueError('No benchmark data, run generate_benchmark_data first.')
+
+    in_stock = list(ProductSize.objects.filter(
+        product__slug__startswith=BENCH_PREFIX, stock__gte=50
+    ).values_list('product__slug', 'pk')[:500])
+    catalog = reverse('main:catalog_all')
+    filter_values = {
+        'color': rng.choice(COLORS),
+        'min_price': '50',
+        'max_price': '100',
+        'size': rng.choice(SIZES),
+    }
+
+    def add_to_cart():
+        slug, size_id = rng.choice(in_stock)
+        url = reverse('cart:add_to_cart', args=[slug])
+        return url, {'size_id': size_id, 'quantity': 1}
+
+    scenarios = [
+        Scenario('index', 'get', reverse('main:index')),
+        Scenario('catalog', 'get', catalog, headers=HX),
+        Scenario('catalog_category', 'get',
+                 reverse('main:catalog', args=[product.category.slug]),
+                 headers=HX),
+        Scenario('catalog_search', 'get', catalog,
+                 {'q': rng.choice(WORDS)}, headers=HX),
+        Scenario('catalog_filters', 'get', catalog,
+                 {'show_filters': 'true'}, headers=HX),
+    ]
+    for param in CatalogView.FILTER_MAPPING:
+        scenarios.append(Scenario(
+            f'catalog_filter_{param}', 'get', catalog,
+            {param: filter_values.get(param, '')}, headers=HX
+        ))
+    scenarios += [
+        Scenario('product_detail', 'get',
+                 reverse('main:product_detail', args=[product.slug]),
+                 headers=HX),
+        Scenario('add_to_cart', 'post', add_to_cart, headers=HX),
+        Scenario('cart_count', 'get', reverse('cart:cart_count')),
+        Scenario('cart_modal', 'get', reverse('cart:cart_modal'), headers=HX),
+    ]
+    return scenarios
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def measure(scenario, client, iterations=50, warmup=5, alloc_iterations=5,
+            warm_cache=False):
+    for _ in range(warmup):
+        scenario(client)
+
+    timings, statuses = [], set()
+    for _ in range(iterations):
+        if not warm_cache:
+            bump_version(CATALOG_VERSION)
+        gc.collect()
+        start = time.perf_counter()
+        response = scenario(client)
+        timings.append((time.perf_counter() - start) * 1000)
+        statuses.add(response.status_code)
+
+    # Query recording and tracemalloc both slow requests down, so they get
+    # their own pass instead of skewing the timings above.
+    queries, allocations = [], []
+    for _ in range(max(alloc_iterations, 1)):
+        if not warm_cache:
+            bump_version(CATALOG_VERSION)
+        gc.collect()
+        tracemalloc.start()
+        with record_queries() as recorder:
+            scenario(client)
+        allocations.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        queries.append(len(recorder))
+
+    return {
+        'iterations': iterations,
+        'status': sorted(statuses),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p99_ms': round(_percentile(timings, 99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'queries': max(queries),
+        'peak_alloc_kb': round(statistics.median(allocations) / 1024, 1),
+    }
+
+
+def run_benchmarks(iterations=50, warmup=5, alloc_iterations=5,
+                   warm_cache=False, only=None, seed=0, log=None):
+    log = log or (lambda message: None)
+    results = {}
+    with override_settings(ALLOWED_HOSTS=['*']):
+        client = Client()
+        scenarios = build_scenarios(seed)
+        # Give the client a populated cart before the cart scenarios run.
+        next(s for s in scenarios if s.name == 'add_to_cart')(client)
+        for scenario in scenarios:
+            if only and scenario.name not in only:
+                continue
+            result = measure(scenario, client, iterations, warmup,
+                             alloc_iterations, warm_cache)
+            results[scenario.name] = result
+            log(f"{scenario.name}: p50 {result['p50_ms']}ms "
+                f"p99 {result['p99_ms']}ms queries {result['queries']} "
+                f"alloc {result['peak_alloc_kb']}KB")
+    return {
+        'products': Product.objects.filter(
+            slug__startswith=BENCH_PREFIX
+        ).count(),
+        'warm_cache': warm_cache,
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance=0.2):
+    regressions = []
+    for name, result in current['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        if result['queries'] > previous['queries']:
+            regressions.append(
+                f"{name}: queries {previous['queries']} -> {result['queries']}"
+            )
+        for metric in ('p50_ms', 'p99_ms', 'peak_alloc_kb'):
+            old, new = previous.get(metric), result.get(metric)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f'{name}: {metric} {old} -> {new}')
+    return regressions
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
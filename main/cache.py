@@ -0,0 +1,253 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, \
+    patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from .models import Category
+
+
+CATEGORIES_VERSION = 'categories'
+CATALOG_VERSION = 'catalog'
+
+_local_categories = {}
+
+
+def _version_key(namespace):
+    return f'main:{namespace}:version'
+
+
+def get_version(namespace):
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(namespace):
+    key = _version_key(namespace)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def _modified_key(namespace):
+    return f'main:{namespace}:modified'
+
+
+def bump_version(namespace):
+    key = _version_key(namespace)
+    cache.set(_modified_key(namespace), time.time(), timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def _latest(stamps):
+    return datetime.fromtimestamp(max(stamps), tz=timezone.utc)
+
+
+def get_modified(*namespaces):
+    keys = [_modified_key(namespace) for namespace in namespaces]
+    stamps = cache.get_many(keys)
+    for key in keys:
+        if key not in stamps:
+            # Lost or never bumped: start from now, which only makes
+            # clients revalidate once.
+            cache.add(key, time.time(), timeout=None)
+            stamps[key] = cache.get(key)
+    return _latest(stamps.values())
+
+
+async def aget_modified(*namespaces):
+    keys = [_modified_key(namespace) for namespace in namespaces]
+    stamps = await cache.aget_many(keys)
+    for key in keys:
+        if key not in stamps:
+            await cache.aadd(key, time.time(), timeout=None)
+            stamps[key] = await cache.aget(key)
+    return _latest(stamps.values())
+
+
+def get_nav_categories():
+    version = get_version(CATEGORIES_VERSION)
+    categories = _local_categories.get(version)
+    if categories is not None:
+        return categories
+
+    key = f'main:categories:{version}'
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.order_by('id'))
+        cache.set(key, categories,
+                  getattr(settings, 'CATEGORY_CACHE_TIMEOUT', 60 * 60 * 24))
+
+    _local_categories.clear()
+    _local_categories[version] = categories
+    return categories
+
+
+async def aget_nav_categories():
+    version = await aget_version(CATEGORIES_VERSION)
+    categories = _local_categories.get(version)
+    if categories is not None:
+        return categories
+
+    key = f'main:categories:{version}'
+    categories = await cache.aget(key)
+    if categories is None:
+        categories = [c async for c in Category.objects.order_by('id')]
+        await cache.aset(key, categories,
+                         getattr(settings, 'CATEGORY_CACHE_TIMEOUT',
+                                 60 * 60 * 24))
+
+    _local_categories.clear()
+    _local_categories[version] = categories
+    return categories
+
+
+def get_response_cache_key(request, versions=None):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    partial = 'hx' if request.headers.get('HX-Request') else 'page'
+    if versions is None:
+        versions = (get_version(CATALOG_VERSION),
+                    get_version(CATEGORIES_VERSION))
+    return 'main:response:{}:{}:{}:{}'.format(*versions, partial, path)
+
+
+class CachedResponseMixin:
+    response_cache_timeout = None
+
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self.adispatch_cached(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') or \
+                request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = get_response_cache_key(request)
+        response = cache.get(key)
+        if response is not None:
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        return self.cache_response(key, response)
+
+
+    async def adispatch_cached(self, request, *args, **kwargs):
+        user = await request.auser()
+        if request.method not in ('GET', 'HEAD') or user.is_authenticated:
+            return await super().dispatch(request, *args, **kwargs)
+
+        key = get_response_cache_key(request, (
+            await aget_version(CATALOG_VERSION),
+            await aget_version(CATEGORIES_VERSION),
+        ))
+        response = await cache.aget(key)
+        if response is not None:
+            return response
+
+        response = await super().dispatch(request, *args, **kwargs)
+        return self.cache_response(key, response)
+
+
+    def cache_response(self, key, response):
+        patch_vary_headers(response, ('HX-Request',))
+        if response.status_code != 200 or response.streaming:
+            return response
+
+        timeout = self.response_cache_timeout
+        if timeout is None:
+            timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60 * 5)
+
+        def store(response):
+            if not response.cookies:
+                cache.set(key, response, timeout)
+
+        if hasattr(response, 'render') and callable(response.render):
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
+
+
+def make_etag(*parts):
+    raw = '|'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+class ConditionalResponseMixin:
+    def get_etag(self):
+        return None
+
+
+    def get_last_modified(self):
+        return None
+
+
+    async def aget_etag(self):
+        return await sync_to_async(self.get_etag)()
+
+
+    async def aget_last_modified(self):
+        return await sync_to_async(self.get_last_modified)()
+
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self.adispatch_conditional(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        etag = self.get_etag()
+        last_modified = self.get_last_modified()
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return self.patch_conditional(response, etag, timestamp)
+
+
+    async def adispatch_conditional(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await super().dispatch(request, *args, **kwargs)
+
+        etag = await self.aget_etag()
+        last_modified = await self.aget_last_modified()
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = await super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return self.patch_conditional(response, etag, timestamp)
+
+
+    def patch_conditional(self, response, etag, timestamp):
+        if etag:
+            response['ETag'] = etag
+        if timestamp:
+            response['Last-Modified'] = http_date(timestamp)
+        # Rendered pages read the session, so the 200 varies on Cookie as
+        # well; a 304 has to carry the same Vary.
+        patch_vary_headers(response, ('HX-Request', 'Cookie'))
+        return response
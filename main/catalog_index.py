@@ -0,0 +1,153 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import InvalidOperation
+from django.conf import settings
+from django.db.models import F
+from .cache import CATALOG_VERSION, get_version
+from .facets import parse_price
+from .models import Product, ProductSize
+from .pagination import CatalogPage, decode_keyset_cursor, encode_cursor
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+SUPPORTED_FILTERS = ('color', 'min_price', 'max_price', 'size')
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def _micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _cents(value):
+    return int((parse_price(value) * 100).to_integral_value())
+
+
+def _bits(positions, size):
+    buf = bytearray((size + 7) // 8)
+    for pos in positions:
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buf, 'little')
+
+
+class CatalogSnapshot:
+    def __init__(self, version):
+        self.version = version
+        rows = list(Product.objects.order_by('-created_at', '-id').values_list(
+            'id', 'category_id', 'color', 'price', 'created_at'
+        ))
+        self.size = len(rows)
+        self.ids = array('q', (row[0] for row in rows))
+        self.created = array('q', (_micros(row[4]) for row in rows))
+        self.all = (1 << self.size) - 1
+        positions = {pk: pos for pos, pk in enumerate(self.ids)}
+
+        categories, colors = {}, {}
+        for pos, row in enumerate(rows):
+            categories.setdefault(row[1], []).append(pos)
+            colors.setdefault(row[2].lower(), []).append(pos)
+        self.categories = {
+            key: _bits(value, self.size) for key, value in categories.items()
+        }
+        self.colors = {
+            key: _bits(value, self.size) for key, value in colors.items()
+        }
+
+        by_price = sorted(range(self.size), key=lambda pos: rows[pos][3])
+        self.price_positions = array('q', by_price)
+        self.prices = array('q', (_cents(rows[pos][3]) for pos in by_price))
+
+        sizes = {}
+        for product_id, name in ProductSize.objects.filter(
+                stock__gt=F('reserved')).values_list('product_id', 'size__name'):
+            if product_id in positions:
+                sizes.setdefault(name, []).append(positions[product_id])
+        self.sizes = {
+            key: _bits(value, self.size) for key, value in sizes.items()
+        }
+
+
+    def price_bits(self, low=None, high=None):
+        start = 0 if low is None else bisect_left(self.prices, low)
+        end = self.size if high is None else bisect_right(self.prices, high)
+        return _bits(self.price_positions[start:end], self.size)
+
+
+    def filter(self, category_id=None, params=None):
+        params = params or {}
+        bits = self.all
+        if category_id is not None:
+            bits &= self.categories.get(category_id, 0)
+        if params.get('color'):
+            bits &= self.colors.get(params['color'].lower(), 0)
+        if params.get('size'):
+            bits &= self.sizes.get(params['size'], 0)
+        low, high = params.get('min_price'), params.get('max_price')
+        if low or high:
+            try:
+                bits &= self.price_bits(
+                    _cents(low) if low else None,
+                    _cents(high) if high else None,
+                )
+            except InvalidOperation:
+                pass
+        return bits
+
+
+    def get_page(self, bits, per_page, cursor=None):
+        start = 0
+        position = decode_keyset_cursor(cursor)
+        if position:
+            created_at, pk = position
+            start = bisect_right(
+                range(self.size), (-_micros(created_at), -pk),
+                key=lambda pos: (-self.created[pos], -self.ids[pos])
+            )
+
+        remaining = bits >> start
+        positions = []
+        while remaining and len(positions) <= per_page:
+            lowest = remaining & -remaining
+            offset = lowest.bit_length() - 1
+            positions.append(start + offset)
+            remaining ^= lowest
+
+        has_next = len(positions) > per_page
+        positions = positions[:per_page]
+        ids = [self.ids[pos] for pos in positions]
+        products = Product.objects.in_bulk(ids)
+        items = [products[pk] for pk in ids if pk in products]
+
+        next_cursor = None
+        if has_next and items:
+            last = items[-1]
+            next_cursor = encode_cursor({
+                'c': last.created_at.isoformat(),
+                'i': last.id,
+            })
+        return CatalogPage(items, next_cursor)
+
+
+def get_catalog_index():
+    global _snapshot
+    if not getattr(settings, 'CATALOG_MEMORY_INDEX', False):
+        return None
+
+    version = get_version(CATALOG_VERSION)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    # Only one thread rebuilds, the others keep answering from the database
+    # until the new snapshot is swapped in.
+    if not _lock.acquire(blocking=False):
+        return None
+    try:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = CatalogSnapshot(version)
+        return _snapshot
+    finally:
+        _lock.release()
@@ -0,0 +1,335 @@
+import csv
+import json
+import os
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from .models import Category, Product, ProductImage, ProductSize, Size
+from .search import get_search_backend
+
+
+FIELDS = ('slug', 'name', 'category', 'color', 'price', 'description',
+          'main_image', 'sizes', 'images')
+PRODUCT_FIELDS = ('name', 'category', 'color', 'price', 'description',
+                  'main_image', 'updated_at')
+
+
+def get_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'csv' if str(path).lower().endswith('.csv') else 'jsonl'
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_sizes(value):
+    if isinstance(value, dict):
+        return {str(name): int(stock) for name, stock in value.items()}
+    sizes = {}
+    for part in filter(None, (value or '').split('|')):
+        name, _, stock = part.partition(':')
+        sizes[name.strip()] = int(stock or 0)
+    return sizes
+
+
+def parse_images(value):
+    if isinstance(value, list):
+        return [str(image) for image in value if image]
+    return [image for image in (value or '').split('|') if image]
+
+
+def read_records(stream, fmt):
+    if fmt == 'csv':
+        rows = csv.DictReader(stream)
+    else:
+        rows = (json.loads(line) for line in stream if line.strip())
+
+    for line, row in enumerate(rows, start=1):
+        try:
+            yield {
+                'slug': (row.get('slug') or '').strip(),
+                'name': row['name'].strip(),
+                'category': str(row['category']).strip(),
+                'color': (row.get('color') or '').strip(),
+                'price': Decimal(str(row['price'])),
+                'description': row.get('description') or '',
+                'main_image': row.get('main_image') or '',
+                'sizes': parse_sizes(row.get('sizes')),
+                'images': parse_images(row.get('images')),
+            }
+        except (KeyError, ValueError, ArithmeticError) as e:
+            raise ValueError(f'Record {line}: {e!r}')
+
+
+class CatalogImporter:
+    def __init__(self, images_dir=None, workers=8, batch_size=1000):
+        self.images_dir = images_dir
+        self.workers = workers
+        self.batch_size = batch_size
+        self.categories = {}
+        self.sizes = {size.name: size for size in Size.objects.all()}
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'images': 0}
+        self.product_ids = []
+        self.category_ids = []
+
+
+    def resolve_categories(self, records):
+        names = [
+            name for name in dict.fromkeys(r['category'] for r in records)
+            if name not in self.categories
+        ]
+        if not names:
+            return
+        slugs = {name: slugify(name) or name for name in names}
+        found = {
+            category.slug: category
+            for category in Category.objects.filter(slug__in=slugs.values())
+        }
+        # Names that differ only in case or punctuation share a slug, so
+        # only one category is created per slug.
+        missing = {}
+        for name, slug in slugs.items():
+            if slug not in found:
+                missing.setdefault(slug, Category(name=name, slug=slug))
+        for category in Category.objects.bulk_create(missing.values()):
+            found[category.slug] = category
+            self.category_ids.append(category.pk)
+        for name, slug in slugs.items():
+            self.categories[name] = found[slug]
+
+
+    def resolve_sizes(self, records):
+        names = {name for r in records for name in r['sizes']} - set(self.sizes)
+        for size in Size.objects.bulk_create([Size(name=n) for n in names]):
+            self.sizes[size.name] = size
+
+
+    def resolve_slugs(self, records):
+        taken = set()
+        pending = []
+        for record in records:
+            if record['slug']:
+                taken.add(record['slug'])
+            else:
+                pending.append(record)
+
+        # Rows without a slug update the product with the same name in the
+        # same category, so importing a file twice does not duplicate them.
+        known = {}
+        for name, category_id, slug in Product.objects.filter(
+                name__in={r['name'] for r in pending},
+                category__in={self.categories[r['category']].pk
+                              for r in pending}).order_by(
+                'pk').values_list('name', 'category_id', 'slug'):
+            known.setdefault((name, category_id), slug)
+
+        leaders, followers = {}, []
+        for record in pending:
+            key = (record['name'], self.categories[record['category']].pk)
+            if key in known:
+                record['slug'] = known[key]
+                taken.add(record['slug'])
+            elif key in leaders:
+                followers.append((record, leaders[key]))
+            else:
+                leaders[key] = record
+        pending = [
+            (record, slugify(record['name'])[:90] or 'product')
+            for record in leaders.values()
+        ]
+
+        # Candidates are checked against the database a chunk at a time,
+        # with numeric suffixes added only for the ones that collide.
+        suffix = 1
+        while pending:
+            candidates = {
+                id(record): base if suffix == 1 else f'{base}-{suffix}'
+                for record, base in pending
+            }
+            existing = set(Product.objects.filter(
+                slug__in=candidates.values()
+            ).values_list('slug', flat=True))
+            retry = []
+            for record, base in pending:
+                slug = candidates[id(record)]
+                if slug in existing or slug in taken:
+                    retry.append((record, base))
+                else:
+                    record['slug'] = slug
+                    taken.add(slug)
+            pending = retry
+            suffix += 1
+
+        for record, leader in followers:
+            record['slug'] = leader['slug']
+
+
+    def store_image(self, name, upload_to):
+        if not name or default_storage.exists(name):
+            return name
+        if self.images_dir:
+            path = os.path.join(self.images_dir, name)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    target = posixpath.join(upload_to, os.path.basename(name))
+                    return default_storage.save(target, File(f))
+        return name
+
+
+    def attach_images(self, records):
+        jobs = []
+        for record in records:
+            jobs.append((record, 'main_image', record['main_image'],
+                         'products/main/'))
+            for index, image in enumerate(record['images']):
+                jobs.append((record, index, image, 'products/extra/'))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            names = list(executor.map(
+                lambda job: self.store_image(job[2], job[3]), jobs
+            ))
+        for (record, key, original, _), name in zip(jobs, names):
+            if name != original:
+                self.stats['images'] += 1
+            if key == 'main_image':
+                record['main_image'] = name
+            else:
+                record['images'][key] = name
+
+
+    def import_chunk(self, records):
+        self.resolve_categories(records)
+        self.resolve_sizes(records)
+        self.resolve_slugs(records)
+        rows = len(records)
+        # A slug repeated within the chunk is one product, the last row wins.
+        records = list({r['slug']: r for r in records}.values())
+        self.attach_images(records)
+        now = timezone.now()
+
+        with transaction.atomic():
+            existing = Product.objects.in_bulk(
+                [r['slug'] for r in records], field_name='slug'
+            )
+            new, changed = [], []
+            for record in records:
+                product = existing.get(record['slug'])
+                if product is None:
+                    product = Product(slug=record['slug'])
+                    new.append(product)
+                else:
+                    changed.append(product)
+                product.name = record['name']
+                product.category = self.categories[record['category']]
+                product.color = record['color']
+                product.price = record['price']
+                product.description = record['description']
+                if record['main_image'] or not product.main_image:
+                    product.main_image = record['main_image']
+                product.updated_at = now
+                record['product'] = product
+
+            Product.objects.bulk_create(new, batch_size=self.batch_size)
+            Product.objects.bulk_update(changed, PRODUCT_FIELDS,
+                                        batch_size=self.batch_size)
+
+            product_ids = [r['product'].pk for r in records]
+            stock = {
+                (ps.product_id, ps.size_id): ps
+                for ps in ProductSize.objects.filter(product__in=product_ids)
+            }
+            images = set(ProductImage.objects.filter(
+                product__in=product_ids
+            ).values_list('product_id', 'image'))
+
+            new_sizes, changed_sizes, new_images = [], [], []
+            for record in records:
+                product = record['product']
+                for name, quantity in record['sizes'].items():
+                    size = self.sizes[name]
+                    product_size = stock.get((product.pk, size.pk))
+                    if product_size is None:
+                        new_sizes.append(ProductSize(
+                            product=product, size=size, stock=quantity
+                        ))
+                    elif product_size.stock != quantity:
+                        product_size.stock = quantity
+                        changed_sizes.append(product_size)
+                for image in record['images']:
+                    if (product.pk, image) not in images:
+                        new_images.append(ProductImage(product=product,
+                                                       image=image))
+
+            ProductSize.objects.bulk_create(new_sizes,
+                                            batch_size=self.batch_size)
+            ProductSize.objects.bulk_update(changed_sizes, ['stock'],
+                                            batch_size=self.batch_size)
+            ProductImage.objects.bulk_create(new_images,
+                                             batch_size=self.batch_size)
+            get_search_backend().update_index(
+                Product.objects.filter(pk__in=product_ids)
+            )
+
+        self.product_ids.extend(product_ids)
+        self.stats['rows'] += rows
+        self.stats['created'] += len(new)
+        self.stats['updated'] += len(changed)
+
+
+    def run(self, records, log=None):
+        for chunk in chunked(records, self.batch_size):
+            self.import_chunk(chunk)
+            if log:
+                log(self.stats)
+        return self.stats
+
+
+def export_records(queryset, chunk_size=2000):
+    queryset = queryset.select_related('category').prefetch_related(
+        'product_sizes__size', 'images'
+    ).order_by('pk')
+    for product in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'slug': product.slug,
+            'name': product.name,
+            'category': product.category.name,
+            'color': product.color,
+            'price': str(product.price),
+            'description': product.description,
+            'main_image': product.main_image.name,
+            'sizes': {
+                ps.size.name: ps.stock for ps in product.product_sizes.all()
+            },
+            'images': [image.image.name for image in product.images.all()],
+        }
+
+
+def write_records(records, stream, fmt):
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        writer.writeheader()
+        for record in records:
+            record['sizes'] = '|'.join(
+                f'{name}:{stock}' for name, stock in record['sizes'].items()
+            )
+            record['images'] = '|'.join(record['images'])
+            writer.writerow(record)
+            yield record
+    else:
+        for record in records:
+            stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+            yield record
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        'The default cache is local to each process.',
+        hint='Catalog and category version stamps live in the default '
+             'cache, so a bump in one worker leaves the others serving '
+             'stale navigation, pages and ETags. Set REDIS_URL, or silence '
+             'main.E001 when running a single process.',
+        id='main.E001',
+    )]
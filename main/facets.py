@@ -0,0 +1,109 @@
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+from django.db.models.functions import Lower
+from .cache import CATALOG_VERSION, get_version
+from .models import ProductSize
+
+
+PRICE_BUCKETS = (
+    (None, 100),
+    (100, 250),
+    (250, 500),
+    (500, 1000),
+    (1000, None),
+)
+
+
+def parse_price(value):
+    price = Decimal(value)
+    if not price.is_finite():
+        raise InvalidOperation(value)
+    return price
+
+
+def price_bucket_q(low, high):
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+def price_bucket_label(low, high):
+    if low is None:
+        return f'UNDER ${high}'
+    if high is None:
+        return f'${low}+'
+    return f'${low} - ${high}'
+
+
+def compute_facets(products, conditions, filter_params):
+    color_q = conditions.get('color', Q())
+    price_q = conditions.get('min_price', Q()) & \
+        conditions.get('max_price', Q())
+    size_q = conditions.get('size', Q())
+
+    products = products.order_by()
+    rows = products.values(value=Lower('color')).annotate(
+        count=Count('id', filter=price_q & size_q),
+        **{
+            f'bucket_{index}': Count(
+                'id', filter=price_bucket_q(low, high) & size_q
+            )
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        }
+    ).order_by('value')
+
+    color = filter_params.get('color', '').lower()
+    colors = []
+    bucket_counts = [0] * len(PRICE_BUCKETS)
+    for row in rows:
+        if row['count']:
+            colors.append({'value': row['value'], 'count': row['count']})
+        if not color or row['value'] == color:
+            for index in range(len(PRICE_BUCKETS)):
+                bucket_counts[index] += row[f'bucket_{index}']
+
+    prices = [
+        {
+            'min': '' if low is None else low,
+            'max': '' if high is None else high,
+            'label': price_bucket_label(low, high),
+            'count': count,
+        }
+        for (low, high), count in zip(PRICE_BUCKETS, bucket_counts)
+        if count
+    ]
+
+    sizes = [
+        {'value': row['size__name'], 'count': row['count']}
+        for row in ProductSize.objects.filter(
+            product__in=products.filter(color_q, price_q).values('pk'),
+            stock__gt=F('reserved'),
+        ).values('size__name').annotate(
+            count=Count('product', distinct=True)
+        ).order_by('size__id')
+    ]
+
+    return {'colors': colors, 'prices': prices, 'sizes': sizes}
+
+
+def get_catalog_facets(products, conditions, category_slug, filter_params):
+    key_data = json.dumps([
+        get_version(CATALOG_VERSION),
+        category_slug or '',
+        sorted(filter_params.items()),
+    ])
+    key = 'main:facets:' + hashlib.md5(key_data.encode()).hexdigest()
+
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(products, conditions, filter_params)
+        cache.set(key, facets,
+                  getattr(settings, 'FACET_CACHE_TIMEOUT', 60 * 10))
+    return facets
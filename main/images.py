@@ -0,0 +1,141 @@
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .cache import CATALOG_VERSION, bump_version
+from .models import Product, ProductImage
+
+
+logger = logging.getLogger(__name__)
+
+RENDITION_FORMATS = {
+    'avif': {'quality': 60},
+    'webp': {'quality': 80, 'method': 6},
+}
+
+_executor = None
+
+
+def get_rendition_widths():
+    return getattr(settings, 'IMAGE_RENDITION_WIDTHS', (320, 640, 960, 1280))
+
+
+def get_rendition_formats():
+    extensions = Image.registered_extensions()
+    return [fmt for fmt in RENDITION_FORMATS if f'.{fmt}' in extensions]
+
+
+def rendition_name(source_name, width, fmt):
+    stem, ext = posixpath.splitext(source_name)
+    return f'renditions/{stem}_{width}.{fmt}'
+
+
+def build_renditions(field_file):
+    storage = field_file.storage
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    width, height = image.size
+    widths = [w for w in get_rendition_widths() if w < width] or [width]
+
+    variants = []
+    for fmt in get_rendition_formats():
+        for target_width in widths:
+            target_height = max(1, round(height * target_width / width))
+            resized = image.resize((target_width, target_height),
+                                   Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            resized.save(buffer, fmt.upper(), **RENDITION_FORMATS[fmt])
+
+            name = rendition_name(field_file.name, target_width, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            name = storage.save(name, ContentFile(buffer.getvalue()))
+            variants.append({
+                'name': name,
+                'format': fmt,
+                'width': target_width,
+                'height': target_height,
+            })
+
+    return {
+        'source': field_file.name,
+        'width': width,
+        'height': height,
+        'variants': variants,
+    }
+
+
+def needs_renditions(field_file, renditions):
+    return bool(field_file) and (renditions or {}).get('source') != field_file.name
+
+
+def render_product(pk):
+    product = Product.objects.filter(pk=pk).first()
+    if product is None or not product.main_image:
+        return False
+    renditions = build_renditions(product.main_image)
+    updated = Product.objects.filter(
+        pk=pk, main_image=product.main_image.name
+    ).update(main_image_renditions=renditions, updated_at=timezone.now())
+    return bool(updated)
+
+
+def render_product_image(pk):
+    product_image = ProductImage.objects.filter(pk=pk).first()
+    if product_image is None or not product_image.image:
+        return False
+    renditions = build_renditions(product_image.image)
+    updated = ProductImage.objects.filter(
+        pk=pk, image=product_image.image.name
+    ).update(renditions=renditions)
+    if updated:
+        Product.objects.filter(pk=product_image.product_id).update(
+            updated_at=timezone.now()
+        )
+    return bool(updated)
+
+
+def _run(func, pk):
+    try:
+        if func(pk):
+            bump_version(CATALOG_VERSION)
+    except Exception:
+        logger.exception('Failed to build image renditions for %s %s',
+                         func.__name__, pk)
+
+
+def _run_in_worker(func, pk):
+    try:
+        _run(func, pk)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_RENDITION_WORKERS', 2),
+            thread_name_prefix='renditions',
+        )
+    return _executor
+
+
+def schedule_renditions(func, pk):
+    if getattr(settings, 'IMAGE_RENDITIONS_ASYNC', True):
+        transaction.on_commit(
+            lambda: get_executor().submit(_run_in_worker, func, pk)
+        )
+    else:
+        transaction.on_commit(lambda: _run(func, pk))
@@ -0,0 +1,37 @@
+import sys
+import time
+from django.core.management.base import BaseCommand
+from main.catalog_io import export_records, get_format, write_records
+from main.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Stream all products to a CSV or JSONL file.'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file, or - for stdout.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = get_format(path, options['format'])
+        records = export_records(Product.objects.all(),
+                                 chunk_size=options['chunk_size'])
+        start = time.monotonic()
+
+        if path == '-':
+            for _ in write_records(records, sys.stdout, fmt):
+                pass
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            count = sum(1 for _ in write_records(records, f, fmt))
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {count} products in {elapsed:.1f}s, '
+            f'{count / max(elapsed, 1e-6):.0f} rows/s.'
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from main.benchmarks import SCALES, clear_benchmark_data, generate_catalog
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic catalog with sizes, images and carts ' \
+           'for the benchmark suite.'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='1k')
+        parser.add_argument('--products', type=int,
+                            help='Exact number of products, overrides --scale.')
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--images', type=int, default=2,
+                            help='Extra images per product.')
+        parser.add_argument('--carts', type=int, default=1000)
+        parser.add_argument('--items-per-cart', type=int, default=3)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete existing benchmark data first.')
+
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            clear_benchmark_data()
+            self.stdout.write('Removed existing benchmark data.')
+
+        products = options['products'] or SCALES[options['scale']]
+        created = generate_catalog(
+            products,
+            categories=options['categories'],
+            images=options['images'],
+            carts=options['carts'],
+            items_per_cart=options['items_per_cart'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {created} benchmark products.'
+        ))
@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from main.cache import CATALOG_VERSION, bump_version
+from main.images import render_product, render_product_image
+from main.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/AVIF renditions for product images.'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate renditions that already exist.')
+        parser.add_argument('--workers', type=int, default=4)
+
+
+    def handle(self, *args, **options):
+        force = options['force']
+        jobs = [
+            (render_product, pk)
+            for pk, name, renditions in Product.objects.exclude(
+                main_image=''
+            ).values_list('pk', 'main_image', 'main_image_renditions')
+            if force or renditions.get('source') != name
+        ]
+        jobs += [
+            (render_product_image, pk)
+            for pk, name, renditions in ProductImage.objects.exclude(
+                image=''
+            ).values_list('pk', 'image', 'renditions')
+            if force or renditions.get('source') != name
+        ]
+
+        def run(job):
+            func, pk = job
+            try:
+                return func(pk)
+            except Exception as exc:
+                self.stderr.write(f'{func.__name__}({pk}) failed: {exc}')
+                return False
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            done = sum(1 for result in executor.map(run, jobs) if result)
+
+        if done:
+            bump_version(CATALOG_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated renditions for {done} of {len(jobs)} images.'
+        ))
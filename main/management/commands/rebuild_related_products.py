@@ -0,0 +1,32 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main.models import Product
+from main.related import get_affected_products, rebuild_related
+
+
+class Command(BaseCommand):
+    help = 'Precompute the related-products list for each product. ' \
+           'Product saves rebuild their own lists, cart co-occurrence is ' \
+           'only picked up here, so schedule it with --since-minutes.'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since-minutes', type=int,
+            help='Only rebuild products affected by product or cart '
+                 'changes in the last N minutes.'
+        )
+
+
+    def handle(self, *args, **options):
+        if options['since_minutes'] is not None:
+            since = timezone.now() - timedelta(minutes=options['since_minutes'])
+            products = get_affected_products(since)
+        else:
+            products = Product.objects.all()
+
+        rebuilt = rebuild_related(products.order_by('pk').iterator())
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt related products for {rebuilt} products.'
+        ))
@@ -0,0 +1,63 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from main.benchmarks import compare, load_results, run_benchmarks, \
+    save_results
+
+
+class Command(BaseCommand):
+    help = 'Measure latency, queries and allocations of the storefront ' \
+           'hot paths and compare them against a stored baseline.'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--alloc-iterations', type=int, default=5)
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep response and facet caches between '
+                                 'iterations instead of invalidating them.')
+        parser.add_argument('--only', nargs='+',
+                            help='Only run the named scenarios.')
+        parser.add_argument('--output', default='benchmarks.json')
+        parser.add_argument('--baseline', default='benchmarks-baseline.json')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative slowdown before a '
+                                 'timing or allocation counts as a regression.')
+        parser.add_argument('--save-baseline', action='store_true')
+
+
+    def handle(self, *args, **options):
+        try:
+            results = run_benchmarks(
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                alloc_iterations=options['alloc_iterations'],
+                warm_cache=options['warm_cache'],
+                only=options['only'],
+                log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        save_results(results, options['output'])
+        self.stdout.write(f"Results written to {options['output']}.")
+
+        baseline = options['baseline']
+        if options['save_baseline']:
+            save_results(results, baseline)
+            self.stdout.write(self.style.SUCCESS(
+                f'Baseline saved to {baseline}.'
+            ))
+            return
+
+        if not os.path.exists(baseline):
+            self.stdout.write(f'No baseline at {baseline}, skipping comparison.')
+            return
+
+        regressions = compare(results, load_results(baseline),
+                              options['tolerance'])
+        if regressions:
+            raise CommandError(
+                'Benchmark regressions:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('No regressions against baseline.'))
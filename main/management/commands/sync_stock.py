@@ -0,0 +1,52 @@
+import csv
+import json
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from main.stock import sync_stock
+
+
+class Command(BaseCommand):
+    help = 'Set ProductSize stock from (slug, size, stock) records in a ' \
+           'CSV or JSONL file.'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, or - for stdin.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Defaults to the file extension, csv for '
+                                 'stdin.')
+        parser.add_argument('--chunk-size', type=int, default=getattr(
+            settings, 'STOCK_SYNC_CHUNK_SIZE', 1000))
+
+
+    def read_records(self, stream, fmt):
+        if fmt == 'jsonl':
+            return (json.loads(line) for line in stream if line.strip())
+        return csv.DictReader(stream)
+
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or (
+            'jsonl' if path.lower().endswith('.jsonl') else 'csv'
+        )
+        start = time.monotonic()
+        try:
+            if path == '-':
+                stats = sync_stock(self.read_records(sys.stdin, fmt),
+                                   chunk_size=options['chunk_size'])
+            else:
+                with open(path, newline='', encoding='utf-8') as f:
+                    stats = sync_stock(self.read_records(f, fmt),
+                                       chunk_size=options['chunk_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {stats['records']} records in {elapsed:.1f}s: "
+            f"{stats['changed']} stock rows changed across "
+            f"{stats['products']} products."
+        ))
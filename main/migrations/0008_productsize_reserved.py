@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsize',
+            name='reserved',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils.text import slugify
 
@@ -30,9 +32,32 @@ class ProductSize(models.Model):
                                 related_name='product_sizes')
     size = models.ForeignKey(Size, on_delete=models.CASCADE)
     stock = models.PositiveIntegerField(default=0)
+    reserved = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.size.name} ({self.stock} in stock) for {self.product.name}"
+    
+
+    @property
+    def available(self):
+        return max(self.stock - self.reserved, 0)
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_sizes(self):
+        return self.prefetch_related(
+            models.Prefetch(
+                'product_sizes',
+                queryset=ProductSize.objects.select_related('size')
+                .order_by('id')
+            )
+        )
+
+
+    def for_detail(self):
+        return self.with_sizes().select_related('category').prefetch_related(
+            'images'
+        )
 
 
 class Product(models.Model):
@@ -44,9 +69,24 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField(blank=True)
     main_image = models.ImageField(upload_to='products/main/')
+    main_image_renditions = models.JSONField(default=dict, blank=True,
+                                             editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)
 
+    objects = ProductQuerySet.as_manager()
+
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'],
+                     name='product_search_vector_idx'),
+            models.Index(fields=['-created_at', '-id'],
+                         name='product_created_id_idx'),
+            models.Index(fields=['category', '-created_at', '-id'],
+                         name='product_cat_created_id_idx'),
+        ]
 
 
     def save(self, *args, **kwargs):
@@ -62,4 +102,22 @@ class Product(models.Model):
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE,
                                 related_name='images')
-    image = models.ImageField(upload_to='products/extra/')    
\ No newline at end of file
+    image = models.ImageField(upload_to='products/extra/')    
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+
+
+class RelatedProduct(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE,
+                                related_name='related_entries')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE,
+                                related_name='+')
+    score = models.FloatField()
+    position = models.PositiveSmallIntegerField()
+
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'position'],
+                                    name='unique_related_position'),
+        ]
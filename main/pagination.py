@@ -0,0 +1,141 @@
+import base64
+import json
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+class CatalogPage:
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def decode_keyset_cursor(cursor):
+    # Cursors come straight from the query string, anything malformed
+    # falls back to the first page.
+    data = decode_cursor(cursor)
+    if not data:
+        return None
+    created_at, pk = data.get('c'), data.get('i')
+    if not isinstance(created_at, str) or type(pk) is not int or \
+            not 0 < pk < 2 ** 63:
+        return None
+    try:
+        created_at = parse_datetime(created_at)
+        if created_at is not None and settings.USE_TZ and \
+                timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at)
+    except (ValueError, TypeError, OverflowError):
+        return None
+    if created_at is None:
+        return None
+    return created_at, pk
+
+
+class KeysetPaginator:
+    ordering = ('-created_at', '-id')
+
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset.order_by(*self.ordering)
+        self.per_page = per_page
+
+
+    def get_page_queryset(self, cursor=None):
+        queryset = self.queryset
+        position = decode_keyset_cursor(cursor)
+        if position:
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) |
+                Q(created_at=created_at, id__lt=pk)
+            )
+        return queryset[:self.per_page + 1]
+
+
+    def build_page(self, items):
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            last = items[-1]
+            next_cursor = encode_cursor({
+                'c': last.created_at.isoformat(),
+                'i': last.id,
+            })
+        return CatalogPage(items, next_cursor)
+
+
+    def get_page(self, cursor=None):
+        return self.build_page(list(self.get_page_queryset(cursor)))
+
+
+    async def aget_page(self, cursor=None):
+        queryset = self.get_page_queryset(cursor)
+        return self.build_page([item async for item in queryset])
+
+
+class RankedPaginator:
+    max_results = 500
+
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+
+    def get_window(self, cursor=None):
+        data = decode_cursor(cursor) or {}
+        offset = data.get('o', 0)
+        if type(offset) is not int or offset < 0:
+            offset = 0
+        return offset, min(self.per_page, self.max_results - offset)
+
+
+    def build_page(self, items, offset, limit):
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            if offset + limit < self.max_results:
+                next_cursor = encode_cursor({'o': offset + limit})
+        return CatalogPage(items, next_cursor)
+
+
+    def get_page(self, cursor=None):
+        offset, limit = self.get_window(cursor)
+        if limit <= 0:
+            return CatalogPage([])
+        items = list(self.queryset[offset:offset + limit + 1])
+        return self.build_page(items, offset, limit)
+
+
+    async def aget_page(self, cursor=None):
+        offset, limit = self.get_window(cursor)
+        if limit <= 0:
+            return CatalogPage([])
+        items = [
+            item async for item in self.queryset[offset:offset + limit + 1]
+        ]
+        return self.build_page(items, offset, limit)
@@ -0,0 +1,174 @@
+import logging
+import re
+import sysconfig
+import time
+import traceback
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, \
+    sync_to_async
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:\?|%s)\s*,?)+\)', re.IGNORECASE)
+_TRANSACTION_RE = re.compile(
+    r'^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE SAVEPOINT)\b', re.IGNORECASE
+)
+_SKIP_FRAMES = (
+    '/django/', '/site-packages/', sysconfig.get_paths()['stdlib'], __file__
+)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def normalize_sql(sql):
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return ' '.join(sql.split())
+
+
+def get_call_site():
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if not any(part in frame.filename for part in _SKIP_FRAMES):
+            return f'{frame.filename}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+def get_budget(url_name):
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(url_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None))
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+
+    def __call__(self, execute, sql, params, many, context):
+        if _TRANSACTION_RE.match(sql):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'shape': normalize_sql(sql),
+                'site': get_call_site(),
+                'time': time.perf_counter() - start,
+            })
+
+
+    def __len__(self):
+        return len(self.queries)
+
+
+    def repeated(self, threshold=None):
+        if threshold is None:
+            threshold = getattr(settings, 'QUERY_BUDGET_REPEAT_THRESHOLD', 3)
+        groups = defaultdict(list)
+        for query in self.queries:
+            groups[(query['shape'], query['site'])].append(query)
+        return [
+            {'shape': shape, 'site': site, 'count': len(queries)}
+            for (shape, site), queries in groups.items()
+            if len(queries) >= threshold
+        ]
+
+
+    def report(self, label, budget=None):
+        problems = []
+        if budget is not None and len(self) > budget:
+            problems.append(f'{label}: {len(self)} queries, budget is {budget}')
+        for group in self.repeated():
+            problems.append(
+                f"{label}: {group['count']}x same query at {group['site']}: "
+                f"{group['shape'][:200]}"
+            )
+        return problems
+
+
+@contextmanager
+def record_queries(using=None):
+    recorder = QueryRecorder()
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+def check_budget(recorder, label, budget=None, raise_errors=None):
+    if raise_errors is None:
+        raise_errors = getattr(settings, 'QUERY_BUDGET_RAISE', False)
+    problems = recorder.report(label, budget)
+    if problems and raise_errors:
+        raise QueryBudgetExceeded('\n'.join(problems))
+    for problem in problems:
+        logger.warning(problem)
+    return problems
+
+
+@contextmanager
+def assert_query_budget(budget=None, url_name=None, label=None):
+    if budget is None and url_name:
+        budget = get_budget(url_name)
+    with record_queries() as recorder:
+        yield recorder
+    check_budget(recorder, label or url_name or 'block', budget, True)
+
+
+class QueryBudgetTestMixin:
+    def assertQueryBudget(self, budget=None, url_name=None):
+        return assert_query_budget(budget, url_name, label=self.id())
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        return self.check_response(request, response, recorder)
+
+
+    async def __acall__(self, request):
+        # Async ORM calls run on the request's sync thread, so the wrappers
+        # are installed on that thread's connections.
+        recording = record_queries()
+        recorder = await sync_to_async(recording.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.__exit__)(None, None, None)
+        return self.check_response(request, response, recorder)
+
+
+    def check_response(self, request, response, recorder):
+        match = request.resolver_match
+        url_name = match.view_name if match else request.path
+        problems = check_budget(recorder, url_name, get_budget(url_name))
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(len(recorder))
+            if problems:
+                response['X-Query-Budget'] = 'exceeded'
+        return response
@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Abs
+from cart.models import CartItem
+from .models import Product, RelatedProduct
+
+
+CATEGORY_WEIGHT = 3.0
+COLOR_WEIGHT = 1.5
+PRICE_WEIGHT = 1.0
+CART_WEIGHT = 3.0
+
+CANDIDATE_LIMIT = 200
+CART_CANDIDATE_LIMIT = 50
+
+
+def get_related_limit():
+    return getattr(settings, 'RELATED_PRODUCTS_LIMIT', 4)
+
+
+def score_related(product):
+    fields = ('id', 'category_id', 'color', 'price')
+    candidates = {
+        row['id']: row
+        for row in Product.objects.filter(
+            category_id=product.category_id
+        ).exclude(pk=product.pk).annotate(
+            price_diff=Abs(F('price') - product.price)
+        ).order_by('price_diff').values(*fields)[:CANDIDATE_LIMIT]
+    }
+
+    co_occurrence = dict(
+        CartItem.objects.filter(
+            cart__in=CartItem.objects.filter(product=product).values('cart')
+        ).exclude(product=product).values('product').annotate(
+            carts=Count('cart', distinct=True)
+        ).order_by('-carts').values_list(
+            'product', 'carts'
+        )[:CART_CANDIDATE_LIMIT]
+    )
+    missing = set(co_occurrence) - set(candidates)
+    if missing:
+        candidates.update(
+            (row['id'], row)
+            for row in Product.objects.filter(pk__in=missing).values(*fields)
+        )
+
+    max_carts = max(co_occurrence.values(), default=0)
+    color = product.color.lower()
+    scores = []
+    for pk, row in candidates.items():
+        score = 0.0
+        if row['category_id'] == product.category_id:
+            score += CATEGORY_WEIGHT
+        if row['color'].lower() == color:
+            score += COLOR_WEIGHT
+        if product.price:
+            distance = abs(row['price'] - product.price) / product.price
+            score += PRICE_WEIGHT * max(0.0, 1.0 - float(distance))
+        if max_carts:
+            score += CART_WEIGHT * co_occurrence.get(pk, 0) / max_carts
+        scores.append((score, pk))
+
+    scores.sort(key=lambda item: (-item[0], -item[1]))
+    return scores[:get_related_limit()]
+
+
+def rebuild_related(products):
+    rebuilt = 0
+    for product in products:
+        entries = [
+            RelatedProduct(product=product, related_id=pk, score=score,
+                           position=position)
+            for position, (score, pk) in enumerate(score_related(product))
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product=product).delete()
+            RelatedProduct.objects.bulk_create(entries)
+        rebuilt += 1
+    return rebuilt
+
+
+def with_dependents(product_ids):
+    # A product's stored list can only change if it or one of the
+    # products it lists changed.
+    affected = set(product_ids)
+    affected |= set(RelatedProduct.objects.filter(
+        related__in=affected
+    ).values_list('product', flat=True))
+    return Product.objects.filter(pk__in=affected)
+
+
+def get_affected_products(since):
+    changed = set(Product.objects.filter(
+        updated_at__gte=since
+    ).values_list('pk', flat=True))
+    changed |= set(CartItem.objects.filter(
+        added_at__gte=since
+    ).values_list('product', flat=True).distinct())
+    return with_dependents(changed)
+
+
+def get_related_products(product):
+    limit = get_related_limit()
+    related = [
+        entry.related
+        for entry in product.related_entries.select_related('related')[:limit]
+    ]
+    if related:
+        return related
+    return list(Product.objects.filter(
+        category_id=product.category_id
+    ).exclude(pk=product.pk)[:limit])
+
+
+async def aget_related_products(product):
+    limit = get_related_limit()
+    related = [
+        entry.related async for entry in
+        product.related_entries.select_related('related')[:limit]
+    ]
+    if related:
+        return related
+    return [
+        item async for item in Product.objects.filter(
+            category_id=product.category_id
+        ).exclude(pk=product.pk)[:limit]
+    ]
@@ -0,0 +1,82 @@
+import re
+from functools import lru_cache
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, \
+    SearchVector
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.utils.module_loading import import_string
+
+
+class BaseSearchBackend:
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+
+    def update_index(self, queryset):
+        pass
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    def __init__(self):
+        self.config = getattr(settings, 'CATALOG_SEARCH_CONFIG', 'english')
+
+
+    def get_vector(self):
+        return (
+            SearchVector('name', weight='A', config=self.config)
+            + SearchVector('color', weight='B', config=self.config)
+            + SearchVector('description', weight='C', config=self.config)
+        )
+
+
+    def get_query(self, query):
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return None
+        return SearchQuery(' & '.join(f'{term}:*' for term in terms),
+                           search_type='raw', config=self.config)
+
+
+    def search(self, queryset, query):
+        search_query = self.get_query(query)
+        if search_query is None:
+            return queryset.none()
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-created_at')
+
+
+    def update_index(self, queryset):
+        queryset.update(search_vector=self.get_vector())
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    def search(self, queryset, query):
+        terms = query.split()
+        if not terms:
+            return queryset.none()
+
+        for term in terms:
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(color__icontains=term) |
+                Q(description__icontains=term)
+            )
+        return queryset.annotate(
+            rank=Case(
+                When(name__icontains=query, then=Value(1.0)),
+                When(color__icontains=query, then=Value(0.4)),
+                default=Value(0.2),
+                output_field=FloatField(),
+            )
+        ).order_by('-rank', '-created_at')
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    backend = getattr(settings, 'CATALOG_SEARCH_BACKEND', None)
+    if backend is None:
+        if connection.vendor == 'postgresql':
+            return PostgresSearchBackend()
+        return SimpleSearchBackend()
+    return import_string(backend)()
@@ -0,0 +1,68 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .cache import CATALOG_VERSION, CATEGORIES_VERSION, bump_version
+from .models import Category, Product, ProductImage, ProductSize
+from .images import needs_renditions, render_product, \
+    render_product_image, schedule_renditions
+from .related import rebuild_related, with_dependents
+from .search import get_search_backend
+
+
+SEARCH_FIELDS = {'name', 'color', 'description'}
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_categories(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(CATEGORIES_VERSION))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductSize)
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(CATALOG_VERSION))
+
+
+@receiver([post_save, post_delete], sender=ProductSize)
+@receiver([post_save, post_delete], sender=ProductImage)
+def touch_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Product.objects.filter(pk=instance.product_id).update(
+        updated_at=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Product)
+def update_search_vector(sender, instance, raw=False, update_fields=None,
+                         **kwargs):
+    if raw or (update_fields and not SEARCH_FIELDS & set(update_fields)):
+        return
+    get_search_backend().update_index(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Product)
+def update_related_products(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Cart co-occurrence is only picked up by the scheduled
+    # rebuild_related_products --since-minutes run, cart writes stay cheap.
+    transaction.on_commit(
+        lambda: rebuild_related(with_dependents([instance.pk]))
+    )
+
+
+@receiver(post_save, sender=Product)
+def build_product_renditions(sender, instance, raw=False, **kwargs):
+    if not raw and needs_renditions(instance.main_image,
+                                    instance.main_image_renditions):
+        schedule_renditions(render_product, instance.pk)
+
+
+@receiver(post_save, sender=ProductImage)
+def build_product_image_renditions(sender, instance, raw=False, **kwargs):
+    if not raw and needs_renditions(instance.image, instance.renditions):
+        schedule_renditions(render_product_image, instance.pk)
@@ -0,0 +1,105 @@
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils import timezone
+from .cache import CATALOG_VERSION, bump_version
+from .models import Product, ProductSize, Size
+
+
+class StockRecordError(ValueError):
+    pass
+
+
+def parse_record(record):
+    try:
+        if isinstance(record, dict):
+            slug, size, stock = record['slug'], record['size'], record['stock']
+        else:
+            slug, size, stock = record
+        stock = int(stock)
+    except (KeyError, TypeError, ValueError):
+        raise StockRecordError(f'Invalid stock record: {record!r}')
+    if stock < 0:
+        raise StockRecordError(f'Negative stock for {slug} ({size}).')
+    return str(slug).strip(), str(size).strip(), stock
+
+
+def _update_postgres(rows):
+    quote = connection.ops.quote_name
+    sizes = quote(ProductSize._meta.db_table)
+    products = quote(Product._meta.db_table)
+    size_names = quote(Size._meta.db_table)
+    values = ', '.join(['(%s, %s, %s::integer)'] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {sizes} AS ps SET stock = v.stock "
+            f"FROM (VALUES {values}) AS v(slug, size, stock), "
+            f"{products} AS p, {size_names} AS s "
+            f"WHERE p.slug = v.slug AND s.name = v.size "
+            f"AND ps.product_id = p.id AND ps.size_id = s.id "
+            f"AND ps.stock <> v.stock "
+            f"RETURNING ps.product_id",
+            [value for row in rows for value in row]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _update_generic(rows):
+    targets = {(slug, size): stock for slug, size, stock in rows}
+    lookup = Q()
+    for slug, size in targets:
+        lookup |= Q(product__slug=slug, size__name=size)
+
+    changed = {}
+    for pk, product_id, slug, size, stock in ProductSize.objects.filter(
+            lookup).values_list('pk', 'product_id', 'product__slug',
+                                'size__name', 'stock'):
+        if targets[slug, size] != stock:
+            changed[pk] = (product_id, targets[slug, size])
+    if not changed:
+        return []
+
+    ProductSize.objects.filter(pk__in=changed).update(stock=Case(
+        *[When(pk=pk, then=Value(stock)) for pk, (_, stock) in changed.items()],
+        output_field=IntegerField(),
+    ))
+    return [product_id for product_id, _ in changed.values()]
+
+
+def sync_stock(records, chunk_size=1000):
+    stats = {'records': 0, 'changed': 0, 'products': 0}
+    update = _update_postgres if connection.vendor == 'postgresql' \
+        else _update_generic
+    chunk = {}
+    product_ids = set()
+
+    def flush():
+        rows = [key + (stock,) for key, stock in chunk.items()]
+        with transaction.atomic():
+            changed = update(rows)
+            if changed:
+                Product.objects.filter(pk__in=set(changed)).update(
+                    updated_at=timezone.now()
+                )
+        stats['changed'] += len(changed)
+        product_ids.update(changed)
+        chunk.clear()
+
+    try:
+        for record in records:
+            slug, size, stock = parse_record(record)
+            # The last record wins when the same SKU shows up twice in a
+            # chunk.
+            chunk[slug, size] = stock
+            stats['records'] += 1
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+    finally:
+        # Chunks commit as they go, so a bad record further down still
+        # leaves earlier changes that cached pages must not hide.
+        if product_ids:
+            transaction.on_commit(lambda: bump_version(CATALOG_VERSION))
+
+    stats['products'] = len(product_ids)
+    return stats
@@ -0,0 +1,51 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+
+register = template.Library()
+
+SOURCE_FORMATS = ('avif', 'webp')
+
+
+@register.simple_tag
+def responsive_image(image, renditions=None, sizes='100vw', **attrs):
+    if not image:
+        return ''
+
+    attrs = {key.replace('_', '-'): value for key, value in attrs.items()}
+    renditions = renditions or {}
+    if renditions.get('source') != image.name:
+        renditions = {}
+
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    if renditions.get('width'):
+        attrs.setdefault('width', renditions['width'])
+        attrs.setdefault('height', renditions['height'])
+
+    img = format_html('<img src="{}"{}>', image.url, flatatt(attrs))
+
+    sources = []
+    for fmt in SOURCE_FORMATS:
+        variants = sorted(
+            (v for v in renditions.get('variants', []) if v['format'] == fmt),
+            key=lambda v: v['width']
+        )
+        if variants:
+            srcset = ', '.join(
+                f"{default_storage.url(v['name'])} {v['width']}w"
+                for v in variants
+            )
+            sources.append((fmt, srcset, sizes))
+
+    if not sources:
+        return img
+    return format_html(
+        '<picture style="display: contents">{}{}</picture>',
+        format_html_join(
+            '', '<source type="image/{}" srcset="{}" sizes="{}">', sources
+        ),
+        img,
+    )
@@ -1,3 +1,664 @@
-from django.test import TestCase
+import base64
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from cart.models import Cart
+from .cache import CATALOG_VERSION, CATEGORIES_VERSION, bump_version, \
+    get_version
+from .catalog_index import CatalogSnapshot
+from .catalog_io import CatalogImporter
+from .checks import check_shared_cache
+from .models import Category, Product, ProductSize, RelatedProduct, Size
+from .facets import compute_facets, get_catalog_facets
+from .pagination import KeysetPaginator
+from .querybudget import QueryBudgetTestMixin
+from .views import CatalogView
+from .related import rebuild_related, score_related
+from .search import PostgresSearchBackend, SimpleSearchBackend, \
+    get_search_backend
+from .stock import StockRecordError, sync_stock
 
-# Create your tests here.
+
+def record(name, category='Pants', slug='', price='10', sizes=None):
+    return {
+        'slug': slug,
+        'name': name,
+        'category': category,
+        'color': 'black',
+        'price': Decimal(price),
+        'description': '',
+        'main_image': '',
+        'sizes': sizes or {},
+        'images': [],
+    }
+
+
+class CatalogImporterTests(TestCase):
+    def run_import(self, records):
+        return CatalogImporter().run(records)
+
+
+    def test_category_names_sharing_a_slug_create_one_category(self):
+        self.run_import([record('A', 'Pants'), record('B', 'pants')])
+
+        self.assertEqual(Category.objects.filter(slug='pants').count(), 1)
+        self.assertEqual(Product.objects.count(), 2)
+
+
+    def test_repeated_slug_in_chunk_keeps_last_row(self):
+        stats = self.run_import([
+            record('A', slug='dup', price='1'),
+            record('B', slug='dup', price='2'),
+        ])
+
+        product = Product.objects.get(slug='dup')
+        self.assertEqual((product.name, product.price), ('B', Decimal('2')))
+        self.assertEqual(stats['rows'], 2)
+        self.assertEqual(stats['created'], 1)
+
+
+    def test_rows_without_slug_are_matched_by_name_and_category(self):
+        rows = [record('New Tee', sizes={'M': 1})]
+        self.run_import(rows)
+        stats = self.run_import([record('New Tee', price='12',
+                                        sizes={'M': 4})])
+
+        product = Product.objects.get()
+        self.assertEqual(product.slug, 'new-tee')
+        self.assertEqual(product.price, Decimal('12'))
+        self.assertEqual(product.product_sizes.get().stock, 4)
+        self.assertEqual((stats['created'], stats['updated']), (0, 1))
+
+
+    def test_same_name_in_another_category_gets_its_own_slug(self):
+        self.run_import([record('Tee', 'Pants'), record('Tee', 'Tops'),
+                         record('Tee', 'Pants')])
+
+        self.assertEqual(
+            sorted(Product.objects.values_list('slug', flat=True)),
+            ['tee', 'tee-2'],
+        )
+
+
+    def test_import_command_refreshes_nav_categories(self):
+        self.assertEqual(self.client.get(reverse('main:catalog_all'))
+                         .status_code, 200)
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as f:
+            f.write(json.dumps({'name': 'Parka', 'category': 'Outerwear',
+                                'price': '99'}) + '\n')
+            f.flush()
+            call_command('import_catalog', f.name, stdout=StringIO())
+
+        response = self.client.get(reverse('main:catalog',
+                                           args=['outerwear']))
+        self.assertEqual(response.status_code, 200)
+
+
+class StockSyncTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Tops', slug='tops')
+        self.sizes = [Size.objects.create(name=name) for name in 'SM']
+        for slug in ('a', 'b'):
+            product = Product.objects.create(
+                name=slug, slug=slug, category=category, color='black',
+                price=Decimal('10'),
+            )
+            for size in self.sizes:
+                ProductSize.objects.create(product=product, size=size,
+                                           stock=5)
+
+
+    def stock(self, slug, size):
+        return ProductSize.objects.get(product__slug=slug,
+                                       size__name=size).stock
+
+
+    def test_counts_only_changed_rows(self):
+        stats = sync_stock([
+            {'slug': 'a', 'size': 'S', 'stock': 5},
+            {'slug': 'a', 'size': 'M', 'stock': 7},
+            ('b', 'S', '0'),
+            ('missing', 'S', 3),
+        ], chunk_size=2)
+
+        self.assertEqual(stats, {'records': 4, 'changed': 2, 'products': 2})
+        self.assertEqual((self.stock('a', 'S'), self.stock('a', 'M'),
+                          self.stock('b', 'S')), (5, 7, 0))
+
+
+    def test_last_record_in_chunk_wins(self):
+        stats = sync_stock([('a', 'S', 1), ('a', 'S', 2)])
+
+        self.assertEqual(stats['changed'], 1)
+        self.assertEqual(self.stock('a', 'S'), 2)
+
+
+    def test_bad_record_still_invalidates_committed_chunks(self):
+        version = get_version(CATALOG_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(StockRecordError):
+                sync_stock([('a', 'S', 1), ('b', 'S', -1)], chunk_size=1)
+
+        self.assertEqual(self.stock('a', 'S'), 1)
+        self.assertNotEqual(get_version(CATALOG_VERSION), version)
+
+
+def raw_cursor(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def walk(get_page):
+    ids, cursor = [], None
+    while True:
+        page = get_page(cursor)
+        ids.extend(product.pk for product in page.object_list)
+        if not page.has_next:
+            return ids
+        cursor = page.next_cursor
+
+
+class SimpleSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tops', slug='tops')
+
+        def make(name, color='grey', description=''):
+            return Product.objects.create(
+                name=name, category=category, color=color,
+                description=description, price=Decimal('10'),
+            )
+
+        cls.described = make('Plain Tee', description='Linen shirt')
+        cls.colored = make('Tee', color='linen')
+        cls.named = make('Linen Shirt')
+        make('Wool Jumper')
+
+
+    def search(self, query):
+        return [product.pk for product in
+                SimpleSearchBackend().search(Product.objects.all(), query)]
+
+
+    def test_name_matches_rank_above_color_and_description(self):
+        self.assertEqual(self.search('linen'),
+                         [self.named.pk, self.colored.pk, self.described.pk])
+
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.search('shirt LINEN'),
+                         [self.named.pk, self.described.pk])
+        self.assertEqual(self.search('   '), [])
+
+
+    def test_backend_follows_database_vendor(self):
+        expected = PostgresSearchBackend \
+            if connection.vendor == 'postgresql' else SimpleSearchBackend
+        self.assertIsInstance(get_search_backend(), expected)
+
+
+    def test_catalog_search_pages_in_rank_order(self):
+        response = self.client.get(reverse('main:catalog_all'),
+                                   {'q': 'linen'},
+                                   headers={'HX-Request': 'true'})
+
+        self.assertEqual(
+            [product.pk for product in response.context['products']],
+            self.search('linen'),
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tops', slug='tops')
+        now = timezone.now()
+        for i in range(7):
+            product = Product.objects.create(
+                name=f'Shirt {i}', category=category, color='black',
+                price=Decimal('10'),
+            )
+            # Pairs share a timestamp so the id tie-break is exercised.
+            Product.objects.filter(pk=product.pk).update(
+                created_at=now - timedelta(minutes=i // 2)
+            )
+        cls.expected = list(Product.objects.order_by(
+            '-created_at', '-id'
+        ).values_list('pk', flat=True))
+
+
+    def test_pages_cover_catalog_in_order(self):
+        paginator = KeysetPaginator(Product.objects.all(), 2)
+
+        self.assertEqual(walk(paginator.get_page), self.expected)
+
+
+    def test_malformed_cursor_returns_first_page(self):
+        paginator = KeysetPaginator(Product.objects.all(), 2)
+        first = [p.pk for p in paginator.get_page().object_list]
+
+        for cursor in ('!!!', raw_cursor([1]), raw_cursor({'c': 5, 'i': 1}),
+                       raw_cursor({'c': '2024-13-45T00:00:00', 'i': 1}),
+                       raw_cursor({'c': 'soon', 'i': 1}),
+                       raw_cursor({'c': '2024-01-01T00:00:00', 'i': '1'}),
+                       raw_cursor({'c': '2024-01-01T00:00:00', 'i': 2 ** 70})):
+            with self.subTest(cursor=cursor):
+                page = paginator.get_page(cursor)
+                self.assertEqual([p.pk for p in page.object_list], first)
+
+
+    def test_catalog_view_ignores_bad_cursor(self):
+        response = self.client.get(
+            reverse('main:catalog_all'),
+            {'cursor': raw_cursor({'c': 5, 'i': 1})},
+            headers={'HX-Request': 'true'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+
+class CatalogIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tops = Category.objects.create(name='Tops', slug='tops')
+        pants = Category.objects.create(name='Pants', slug='pants')
+        sizes = [Size.objects.create(name=name) for name in 'SML']
+        now = timezone.now()
+        for i in range(20):
+            product = Product.objects.create(
+                name=f'Item {i}', category=(cls.tops, pants)[i % 2],
+                color=('Black', 'white', 'navy')[i % 3],
+                price=Decimal(40 + i * 7) + Decimal('0.5'),
+            )
+            Product.objects.filter(pk=product.pk).update(
+                created_at=now - timedelta(minutes=i // 3)
+            )
+            for size in sizes[:i % 4]:
+                ProductSize.objects.create(product=product, size=size,
+                                           stock=i % 2, reserved=0)
+
+
+    def database_ids(self, category, params):
+        conditions = [
+            CatalogView.FILTER_MAPPING[param](value)
+            for param, value in params.items()
+        ]
+        products = Product.objects.filter(*conditions)
+        if category:
+            products = products.filter(category=category)
+        return walk(KeysetPaginator(products, 3).get_page)
+
+
+    def index_ids(self, snapshot, category, params):
+        bits = snapshot.filter(category.pk if category else None, params)
+        return walk(lambda cursor: snapshot.get_page(bits, 3, cursor))
+
+
+    def test_matches_database_for_each_filter(self):
+        snapshot = CatalogSnapshot(0)
+        for category in (None, self.tops):
+            for params in ({}, {'color': 'BLACK'}, {'size': 'M'},
+                           {'min_price': '80'}, {'max_price': '100.5'},
+                           {'min_price': '60', 'max_price': '120',
+                            'color': 'white', 'size': 'S'}):
+                with self.subTest(category=category, params=params):
+                    self.assertEqual(
+                        self.index_ids(snapshot, category, params),
+                        self.database_ids(category, params),
+                    )
+
+
+    def test_catalog_view_serves_the_same_page(self):
+        url = reverse('main:catalog', args=['tops'])
+        params = {'color': 'black', 'max_price': '150'}
+
+        def page():
+            cache.clear()
+            response = self.client.get(url, params,
+                                       headers={'HX-Request': 'true'})
+            return [product.pk for product in response.context['products']]
+
+        expected = page()
+        with override_settings(CATALOG_MEMORY_INDEX=True):
+            self.assertEqual(page(), expected)
+        self.assertTrue(expected)
+
+
+    def test_malformed_cursor_returns_first_page(self):
+        snapshot = CatalogSnapshot(0)
+        first = snapshot.get_page(snapshot.all, 3).object_list
+
+        page = snapshot.get_page(snapshot.all, 3, raw_cursor({'c': 5, 'i': 1}))
+
+        self.assertEqual(page.object_list, first)
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tops', slug='tops')
+        small, medium = Size.objects.create(name='S'), \
+            Size.objects.create(name='M')
+        for color, price, size in (('Black', '50', small),
+                                   ('black', '150', medium),
+                                   ('White', '150', small)):
+            product = Product.objects.create(
+                name=f'{color} {price}', category=category, color=color,
+                price=Decimal(price),
+            )
+            ProductSize.objects.create(product=product, size=size, stock=1)
+
+
+    def setUp(self):
+        cache.clear()
+
+
+    def test_counts_ignore_their_own_filter(self):
+        conditions = {'color': Q(color__iexact='black')}
+        facets = compute_facets(Product.objects.all(), conditions,
+                                {'color': 'black'})
+
+        self.assertEqual(facets['colors'], [
+            {'value': 'black', 'count': 2},
+            {'value': 'white', 'count': 1},
+        ])
+        self.assertEqual([(p['label'], p['count']) for p in facets['prices']],
+                         [('UNDER $100', 1), ('$100 - $250', 1)])
+        self.assertEqual(facets['sizes'], [
+            {'value': 'S', 'count': 1},
+            {'value': 'M', 'count': 1},
+        ])
+
+
+    def test_cache_key_covers_filters_and_catalog_version(self):
+        products = Product.objects.all()
+
+        def facets(params):
+            return get_catalog_facets(products, {}, 'tops', params)
+
+        with self.assertNumQueries(2):
+            facets({'color': ''})
+        with self.assertNumQueries(0):
+            facets({'color': ''})
+        with self.assertNumQueries(2):
+            facets({'color': 'white'})
+        bump_version(CATALOG_VERSION)
+        with self.assertNumQueries(2):
+            facets({'color': ''})
+
+
+    def test_non_finite_prices_are_ignored(self):
+        for params in ({'min_price': 'nan'}, {'max_price': 'Infinity'},
+                       {'min_price': 'sNaN', 'show_filters': 'true'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('main:catalog_all'),
+                                           params,
+                                           headers={'HX-Request': 'true'})
+                self.assertEqual(response.status_code, 200)
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tops', slug='tops')
+        Product.objects.create(name='Shirt', category=category,
+                               color='black', price=Decimal('10'))
+
+
+    def setUp(self):
+        cache.clear()
+
+
+    def test_full_pages_and_partials_are_cached_apart(self):
+        for name in ('main:index', 'main:catalog_all'):
+            url = reverse(name)
+            with self.subTest(url=url):
+                page = self.client.get(url).content
+                partial = self.client.get(
+                    url, headers={'HX-Request': 'true'}
+                ).content
+
+                self.assertIn(b'<!DOCTYPE html>', page)
+                self.assertNotIn(b'<!DOCTYPE html>', partial)
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.client.get(url).content, page)
+                    self.assertEqual(self.client.get(
+                        url, headers={'HX-Request': 'true'}
+                    ).content, partial)
+
+
+    def test_version_bump_invalidates_cached_pages(self):
+        url = reverse('main:catalog_all')
+        self.client.get(url, headers={'HX-Request': 'true'})
+
+        for namespace in (CATALOG_VERSION, CATEGORIES_VERSION):
+            with self.subTest(namespace=namespace):
+                name = f'Renamed {namespace}'
+                Product.objects.update(name=name)
+                self.assertNotContains(self.client.get(
+                    url, headers={'HX-Request': 'true'}
+                ), name)
+
+                bump_version(namespace)
+                self.assertContains(self.client.get(
+                    url, headers={'HX-Request': 'true'}
+                ), name)
+
+
+    def test_logged_in_users_are_not_served_cached_pages(self):
+        url = reverse('main:index')
+        self.client.get(url)
+        self.client.force_login(
+            get_user_model().objects.create(email='user@example.com')
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+
+        self.assertTrue(queries)
+
+
+class AsyncStorefrontTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tops', slug='tops')
+        cls.product = Product.objects.create(
+            name='Shirt', category=category, color='black',
+            price=Decimal('10'),
+        )
+
+
+    def setUp(self):
+        cache.clear()
+
+
+    async def test_catalog(self):
+        for url in (reverse('main:catalog_all'),
+                    reverse('main:catalog', args=['tops'])):
+            for headers in ({}, {'HX-Request': 'true'}):
+                with self.subTest(url=url, headers=headers):
+                    response = await self.async_client.get(url,
+                                                           headers=headers)
+                    self.assertEqual(response.status_code, 200)
+                    if headers:
+                        self.assertContains(response, 'Shirt')
+
+        response = await self.async_client.get(
+            reverse('main:catalog', args=['missing'])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+    async def test_product_detail(self):
+        url = reverse('main:product_detail', args=[self.product.slug])
+        response = await self.async_client.get(
+            url, headers={'HX-Request': 'true'}
+        )
+        self.assertContains(response, 'SHIRT')
+
+        response = await self.async_client.get(url, headers={
+            'HX-Request': 'true', 'If-None-Match': response['ETag'],
+        })
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get(
+            reverse('main:product_detail', args=['missing'])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class RelatedProductTests(TestCase):
+    def setUp(self):
+        self.tops = Category.objects.create(name='Tops', slug='tops')
+        self.pants = Category.objects.create(name='Pants', slug='pants')
+        self.size = Size.objects.create(name='M')
+        self.product = self.make('Shirt', self.tops, 'black', '100')
+
+
+    def make(self, name, category, color, price):
+        product = Product.objects.create(name=name, category=category,
+                                         color=color, price=Decimal(price))
+        ProductSize.objects.create(product=product, size=self.size, stock=5)
+        return product
+
+
+    def ranking(self):
+        return [pk for score, pk in score_related(self.product)]
+
+
+    def test_category_color_and_price_order_candidates(self):
+        close = self.make('Close', self.tops, 'Black', '110')
+        far = self.make('Far', self.tops, 'black', '300')
+        other_color = self.make('White', self.tops, 'white', '100')
+        self.make('Pants', self.pants, 'black', '100')
+
+        self.assertEqual(self.ranking(), [close.pk, far.pk, other_color.pk])
+
+
+    def test_cart_co_occurrence_adds_other_categories(self):
+        same = self.make('Tee', self.tops, 'white', '100')
+        pants = self.make('Pants', self.pants, 'grey', '40')
+        for key in ('a', 'b'):
+            cart = Cart.objects.create(session_key=key)
+            for product in (self.product, pants):
+                cart.add_product(product, product.product_sizes.get(), 1)
+
+        self.assertEqual(self.ranking(), [same.pk, pants.pk])
+        scores = dict((pk, score) for score, pk in score_related(self.product))
+        self.assertGreater(scores[pants.pk], 0)
+
+
+    def test_saving_a_product_rebuilds_lists_that_contain_it(self):
+        other = self.make('Tee', self.tops, 'black', '100')
+        rebuild_related([self.product, other])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.category = self.pants
+            self.product.save()
+
+        self.assertFalse(RelatedProduct.objects.exists())
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Tops', slug='tops')
+        size = Size.objects.create(name='M')
+        for i in range(30):
+            product = Product.objects.create(
+                name=f'Shirt {i}', category=category, color='black',
+                price=Decimal('10.00') + i,
+            )
+            ProductSize.objects.create(product=product, size=size, stock=5)
+        cls.product = product
+        cls.product_size = product.product_sizes.get()
+
+
+    def setUp(self):
+        cache.clear()
+
+
+    def get(self, url_name, *args, **headers):
+        with self.assertQueryBudget(url_name=url_name):
+            response = self.client.get(reverse(url_name, args=args),
+                                       headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+    def test_index(self):
+        self.get('main:index')
+
+
+    def test_catalog(self):
+        self.get('main:catalog_all', HX_Request='true')
+        self.get('main:catalog', 'tops', HX_Request='true')
+
+
+    def test_product_detail(self):
+        self.get('main:product_detail', self.product.slug, HX_Request='true')
+
+
+    def test_cart_views(self):
+        with self.assertQueryBudget(url_name='cart:add_to_cart'):
+            self.client.post(
+                reverse('cart:add_to_cart', args=[self.product.slug]),
+                {'size_id': self.product_size.pk, 'quantity': 1},
+            )
+        self.get('cart:cart_count')
+        self.get('cart:cart_modal')
+
+
+    def test_catalog_etag_follows_catalog_version(self):
+        url = reverse('main:catalog_all')
+        response = self.client.get(url, headers={'HX-Request': 'true'})
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, headers={'HX-Request': 'true',
+                                                   'If-None-Match': etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['Vary'], response['Vary'])
+        self.assertEqual(
+            self.client.get(url, headers={
+                'HX-Request': 'true',
+                'If-Modified-Since': response['Last-Modified'],
+            }).status_code, 304
+        )
+
+        with mock.patch('main.cache.time.time', return_value=4102444800):
+            bump_version(CATALOG_VERSION)
+        response = self.client.get(url, headers={'HX-Request': 'true',
+                                                 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response['Last-Modified'],
+                         'Fri, 01 Jan 2100 00:00:00 GMT')
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    def backend(self, backend):
+        return override_settings(CACHES={'default': {'BACKEND': backend}})
+
+
+    def test_process_local_cache_is_an_error(self):
+        with self.backend('django.core.cache.backends.locmem.LocMemCache'):
+            errors = check_shared_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['main.E001'])
+
+
+    def test_shared_cache_passes(self):
+        with self.backend('django.core.cache.backends.redis.RedisCache'):
+            self.assertEqual(check_shared_cache(None), [])
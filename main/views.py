@@ -1,18 +1,36 @@
-from django.shortcuts import get_object_or_404
-from django.views.generic import TemplateView, DetailView
-from django.http import HttpResponse
+from django.http import Http404
+from django.views.generic import TemplateView, DetailView, View
+from django.http import JsonResponse
+from django.conf import settings
+from django.db import transaction
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from django.template.response import TemplateResponse
-from .models import Category, Product, Size
-from django.db.models import Q
+from django.db.models import Exists, F, OuterRef, Q
+from .models import Product, ProductSize
+from .cache import CATALOG_VERSION, CATEGORIES_VERSION, \
+    CachedResponseMixin, ConditionalResponseMixin, aget_modified, \
+    aget_nav_categories, aget_version, get_nav_categories, make_etag
+from .catalog_index import SUPPORTED_FILTERS, get_catalog_index
+from .facets import get_catalog_facets, parse_price
+from .pagination import KeysetPaginator, RankedPaginator
+from .related import aget_related_products
+from .search import get_search_backend
+from .stock import StockRecordError, parse_record, sync_stock
+from asgiref.sync import sync_to_async
+from decimal import InvalidOperation
+import hmac
+import json
 
 
-class IndexView(TemplateView):
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class IndexView(CachedResponseMixin, TemplateView):
     template_name = 'main/base.html'
 
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
+        context['categories'] = get_nav_categories()
         context['current_category'] = None
         return context
     
@@ -24,52 +42,118 @@ class IndexView(TemplateView):
         return TemplateResponse(request, self.template_name, context)
     
 
-class CatalogView(TemplateView):
-    template ='main/base.html'
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class CatalogView(ConditionalResponseMixin, CachedResponseMixin,
+                  TemplateView):
+    template_name = 'main/base.html'
+    paginate_by = 24
 
     FILTER_MAPPING = {
-        'color': lambda queryset, value: queryset.filter(color__iexact=value),
-        'main_price': lambda queryset, value: queryset.filter(price_gte=value),
-        'max_price': lambda queryset, value: queryset.filter(price_lte=value),
-        'size': lambda queryset, value: queryset.filter(product_sizes__size__name=value),
+        'color': lambda value: Q(color__iexact=value),
+        'min_price': lambda value: Q(price__gte=parse_price(value)),
+        'max_price': lambda value: Q(price__lte=parse_price(value)),
+        'size': lambda value: Q(Exists(ProductSize.objects.filter(
+            product=OuterRef('pk'), size__name=value, stock__gt=F('reserved')
+        ))),
     }   
 
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        category_slug = kwargs.get('category_slug')
-        categories = Category.objects.all()
+    def get_categories(self):
+        if not hasattr(self, 'categories'):
+            self.categories = get_nav_categories()
+        return self.categories
+
+
+    async def aget_categories(self):
+        if not hasattr(self, 'categories'):
+            self.categories = await aget_nav_categories()
+        return self.categories
+
+
+    def filter_products(self):
+        if hasattr(self, 'products'):
+            return self.products
+
+        category_slug = self.kwargs.get('category_slug')
         products = Product.objects.all().order_by('-created_at')
         current_category = None
         
         if category_slug:
-            current_category = get_object_or_404(Category, slug=category_slug)
+            current_category = next(
+                (c for c in self.get_categories() if c.slug == category_slug),
+                None
+            )
+            if current_category is None:
+                raise Http404('No Category matches the given query.')
             products = products.filter(category=current_category)
 
         query = self.request.GET.get('q')    
         if query:
-            products = products.filter(
-                Q(name__icontains=query) | Q(description__icontains=query)
-            )
+            products = get_search_backend().search(products, query)
 
         filter_params = {}
+        conditions = {}
         for param, filter_func in self.FILTER_MAPPING.items():
-            value = self.request.GET.get(param)
+            value = self.request.GET.get(param, '')
             if value:
-                products = filter_func(products, value)
-                filter_params[param] = value
-            else:
-                filter_params[param] = ''
+                try:
+                    conditions[param] = filter_func(value)
+                except InvalidOperation:
+                    value = ''
+            filter_params[param] = value
 
         filter_params['q'] = query or ''
+        self.current_category = current_category
+        self.base_products = products
+        self.filter_conditions = conditions
+        self.filter_params = filter_params
+        self.products = products.filter(*conditions.values())
+        return self.products
+    
+
+    def get_catalog_index(self):
+        if hasattr(self, 'catalog_index'):
+            return self.catalog_index
+
+        self.filter_products()
+        self.catalog_index = None
+        unsupported = set(self.filter_conditions) - set(SUPPORTED_FILTERS)
+        if not self.filter_params['q'] and not unsupported:
+            index = get_catalog_index()
+            if index is not None:
+                category = self.current_category
+                self.catalog_index = index
+                self.catalog_index_bits = index.filter(
+                    category.pk if category else None, self.filter_params
+                )
+        return self.catalog_index
+    
+
+    async def aget_etag(self):
+        # Every catalog write bumps the catalog version, so it identifies
+        # the listing without aggregating over the products per request.
+        return make_etag(
+            self.request.get_full_path(),
+            bool(self.request.headers.get('HX-Request')),
+            await aget_version(CATALOG_VERSION),
+            await aget_version(CATEGORIES_VERSION),
+        )
+    
+
+    async def aget_last_modified(self):
+        return await aget_modified(CATALOG_VERSION, CATEGORIES_VERSION)
+    
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        products = self.filter_products()
 
         context.update({
-            'categories': categories,
+            'categories': self.get_categories(),
             'products': products,
-            'current_category': category_slug,
-            'filter_params': filter_params,
-            'sizes': Size.objects.all(),
-            'search_query': query or ''
+            'current_category': kwargs.get('category_slug'),
+            'filter_params': self.filter_params,
+            'search_query': self.filter_params['q']
         })   
 
         if self.request.GET.get('show_search') == 'true':
@@ -80,39 +164,152 @@ class CatalogView(TemplateView):
         return context
     
 
-    def get(self, request, *args, **kwargs):
-        context = self.get_context_data (**kwargs)
+    def get_paginator(self, context):
+        if context['search_query']:
+            return RankedPaginator(context['products'], self.paginate_by)
+        return KeysetPaginator(context['products'], self.paginate_by)
+
+
+    async def apaginate_products(self, context):
+        cursor = self.request.GET.get('cursor')
+        index = await sync_to_async(self.get_catalog_index)()
+        if index is not None:
+            page = await sync_to_async(index.get_page)(
+                self.catalog_index_bits, self.paginate_by, cursor
+            )
+        else:
+            page = await self.get_paginator(context).aget_page(cursor)
+        self.update_page_context(context, page)
+
+
+    def update_page_context(self, context, page):
+        next_page_url = None
+        if page.has_next:
+            params = self.request.GET.copy()
+            for param in ('show_filters', 'show_search', 'reset_search'):
+                params.pop(param, None)
+            params['cursor'] = page.next_cursor
+            next_page_url = f'{self.request.path}?{params.urlencode()}'
+
+        context.update({
+            'page': page,
+            'products': page.object_list,
+            'next_page_url': next_page_url,
+        })
+    
+
+    async def get(self, request, *args, **kwargs):
+        await self.aget_categories()
+        context = self.get_context_data(**kwargs)
         if request.headers.get('HX-Request'):
             if context.get('show_search'):
                 return TemplateResponse(request, 'main/search_input.html', context)
             elif context.get('reset_search'):
                 return TemplateResponse(request, 'main/search_button.html', {})
-            temlate = 'main/filter_modal.html' if request.GET.get('show_filters') == 'true' else 'main/catalog.html'
+            elif request.GET.get('show_filters') == 'true':
+                context['facets'] = await sync_to_async(get_catalog_facets)(
+                    self.base_products,
+                    self.filter_conditions,
+                    context['current_category'],
+                    context['filter_params'],
+                )
+                return TemplateResponse(request, 'main/filter_modal.html', context)
+            await self.apaginate_products(context)
+            temlate = 'main/catalog_page.html' if request.GET.get('cursor') else 'main/catalog.html'
             return TemplateResponse(request, temlate, context)
         return TemplateResponse(request, self.template_name, context)
     
 
-class ProductDetailView(DetailView):
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class ProductDetailView(ConditionalResponseMixin, CachedResponseMixin,
+                        DetailView):
     model = Product
     template_name = 'main/base.html'
     slug_field = 'slug' 
     slug_url_kwarg = 'slug'
 
 
+    async def aget_last_modified(self):
+        if not hasattr(self, 'last_modified'):
+            self.last_modified = await Product.objects.filter(
+                slug=self.kwargs.get(self.slug_url_kwarg)
+            ).values_list('updated_at', flat=True).afirst()
+        return self.last_modified
+
+
+    async def aget_etag(self):
+        last_modified = await self.aget_last_modified()
+        if last_modified is None:
+            return None
+        return make_etag(
+            self.kwargs.get(self.slug_url_kwarg),
+            bool(self.request.headers.get('HX-Request')),
+            await aget_version(CATALOG_VERSION),
+            await aget_version(CATEGORIES_VERSION),
+            last_modified,
+        )
+
+
+    def get_queryset(self):
+        return Product.objects.for_detail()
+
+
+    async def aget_object(self):
+        try:
+            return await self.get_queryset().aget(
+                slug=self.kwargs.get(self.slug_url_kwarg)
+            )
+        except Product.DoesNotExist:
+            raise Http404('No Product matches the given query.')
+
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        product = self.get_object()
-        context['categories'] = Category.objects.all()
-        context['related_products'] = Product.objects.filter(
-            category=product.category
-        ).exclude(id=product.id)[:4]
+        product = self.object
+        context['categories'] = self.categories
+        context['related_products'] = self.related_products
         context['current_category'] = product.category.slug
         return context
 
 
-    def get(self, request, *args, **kwargs):
-        self.object = self.get_object()
+    async def get(self, request, *args, **kwargs):
+        self.object = await self.aget_object()
+        self.categories = await aget_nav_categories()
+        self.related_products = await aget_related_products(self.object)
         context = self.get_context_data(**kwargs)
         if request.headers.get('HX-Request'):
             return TemplateResponse(request, 'main/product_detail.html', context)
-        return TemplateResponse(request, self.template_name, context)   
+        return TemplateResponse(request, self.template_name, context)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class StockSyncView(View):
+    def has_valid_token(self, request):
+        token = getattr(settings, 'STOCK_SYNC_TOKEN', None)
+        header = request.headers.get('Authorization', '')
+        if not token or not header.startswith('Bearer '):
+            return False
+        return hmac.compare_digest(header[7:].encode(), token.encode())
+
+
+    def post(self, request):
+        if not self.has_valid_token(request):
+            return JsonResponse({'error': 'Invalid token'}, status=403)
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        if isinstance(payload, dict):
+            payload = payload.get('records')
+        if not isinstance(payload, list):
+            return JsonResponse({'error': 'Expected a list of records'},
+                                status=400)
+
+        # Validate everything up front so a bad record rejects the whole
+        # payload instead of leaving earlier chunks applied.
+        try:
+            records = [parse_record(record) for record in payload]
+        except StockRecordError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(sync_stock(records, chunk_size=getattr(
+            settings, 'STOCK_SYNC_CHUNK_SIZE', 1000)))
@@ -5,10 +5,10 @@ app_name = 'users'
 
 urlpatterns = [
     path('register/', views.register, name='register'),
-    path('login/', views.login, name='login'),
+    path('login/', views.login_view, name='login'),
     path('profile/', views.profile_view, name='profile'),
     path('account-details/', views.account_details, name='account_details'),
     path('edit-account-details/', views.edit_account_details, name='edit_account_details'),
     path('update-account-details/', views.update_account_details, name='update_account_details'),
-    path('logout/', views.logout, name='logout'),
+    path('logout/', views.logout_view, name='logout'),
 ]
\ No newline at end of file